@@ -10,11 +10,30 @@ import os
 import re
 import json
 import time
+import queue
+import sqlite3
+import random
+import hashlib
+import argparse
+import functools
+import threading
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 import subprocess
 import requests
-from faster_whisper import WhisperModel
+# faster_whisper is imported where it's first used (load_whisper_model,
+# decode_spark_audio): the import alone takes seconds, which main() spends
+# listing and probing Sparks while the model loads in the background
+
+import catalyst_metrics
+
+try:
+    import av  # Optional: in-process duration probing (pip install av)
+except ImportError:
+    av = None
 
 # ============================================================================
 # CONFIGURATION - Edit these to match your setup
@@ -29,6 +48,75 @@ OUTPUT_DIR = "/mnt/z/Catalyst-Demo"
 # Your FastAPI endpoint on wcn-oglaptop
 OLLAMA_ENDPOINT = "http://wcn-oglaptop:8000/api/review"
 
+# Raw-prompt endpoint on the same gateway (used for streamed analysis)
+OLLAMA_ANALYZE_ENDPOINT = "http://wcn-oglaptop:8000/api/analyze"
+
+# Batch endpoint: many transcripts per round-trip through the tunnel
+OLLAMA_BATCH_ENDPOINT = "http://wcn-oglaptop:8000/api/analyze/batch"
+
+# Where the static analysis instructions are registered once per run
+OLLAMA_TEMPLATES_ENDPOINT = "http://wcn-oglaptop:8000/api/templates"
+
+# Send ANALYSIS_INSTRUCTIONS as a registered gateway template (Ollama's system
+# prompt) and only the transcript per request, so Ollama reuses the evaluated
+# instruction prefix instead of re-reading it for every Spark
+PREFIX_TEMPLATE = True
+
+# Sparks per batch request (0 or 1 = one request per Spark)
+ANALYSIS_BATCH_SIZE = 0
+
+# Longest the analyze stage waits for a batch to fill before sending it
+BATCH_WAIT_SECONDS = 30
+
+# Analysis requests in flight at once, across the analyze stage threads and
+# the early map chunks of a long Spark (one shared limit). They share one
+# pool of keep-alive connections to the gateway, so a short Spark doesn't pay
+# a fresh TCP + TLS handshake through the tunnel. A request waiting in the
+# gateway's queue spends GATEWAY_READ_TIMEOUT too, so with a single GPU a
+# second one mostly times out and is retried while the first generates;
+# raise this only with more Ollama backends behind the gateway.
+ANALYSIS_IN_FLIGHT = 1
+
+# Gateway timeouts: connecting, and the longest wait for the next bytes
+# (per token batch when streaming, the whole answer otherwise)
+GATEWAY_CONNECT_TIMEOUT = 10
+GATEWAY_READ_TIMEOUT = 60
+
+# Retries after timeouts, dropped connections, 5xx, 429 or unparseable
+# output wait a random time up to BASE * 2^attempt (capped), or what the
+# gateway's Retry-After asks for; other 4xx responses aren't retried
+RETRY_BACKOFF_BASE = 1.0
+RETRY_BACKOFF_MAX = 30.0
+
+# Ask the gateway to answer repeat prompts from its response cache
+# (re-runs after an output-formatting fix then skip the GPU entirely).
+# Off by default; retries always bypass it so they get a fresh generation.
+USE_GATEWAY_CACHE = False
+
+# Have the gateway constrain Mistral's output to ANALYSIS_SCHEMA and repair
+# only missing fields, instead of retrying whole generations on bad JSON
+STRUCTURED_ANALYSIS = False
+
+# Field repairs the gateway may run after a structured generation (its
+# STRUCTURED_REPAIR_ATTEMPTS); read timeouts allow for all of them
+STRUCTURED_REPAIR_ATTEMPTS = 2
+
+# Long Sparks: transcripts estimated above SINGLE_SHOT_MAX_TOKENS are split
+# along Whisper segment boundaries into ~ANALYSIS_CHUNK_TOKENS windows,
+# analyzed in parallel (map) and merged (reduce). Sized for Ollama's
+# default 2048-token context with ~600 tokens of instructions and answer.
+SINGLE_SHOT_MAX_TOKENS = 1400
+ANALYSIS_CHUNK_TOKENS = 1200
+
+# Long Sparks transcribed in-process start their map step while Whisper is
+# still running: each finished chunk goes to Mistral as soon as the
+# transcript is known to be too long for a single-shot analysis
+EARLY_ANALYSIS = True
+
+# Stream tokens back and stop as soon as the analysis JSON object closes,
+# instead of waiting for (and paying for) the whole generation
+STREAM_ANALYSIS = False
+
 # How many Sparks to process (start small for testing)
 MAX_SPARKS = 10
 
@@ -39,6 +127,101 @@ DEBUG_MODE = True
 # "base" is fast and good enough for demo
 WHISPER_MODEL = "base"
 
+# Whisper decoding settings (these also key the transcript cache)
+WHISPER_LANGUAGE = "en"  # Force English, or use None for auto-detect
+WHISPER_BEAM_SIZE = 5
+WHISPER_COMPUTE_TYPE = "int8"
+
+# Named speed/accuracy trade-offs for transcription. Only segment text and
+# boundaries are used downstream, so word timings are a pure cost outside
+# "accurate" (the original settings). Compare them with
+# transcription_benchmark.py --profiles before switching.
+TRANSCRIBE_PROFILES = {
+    'fast': {'model': 'tiny', 'beam_size': 1, 'word_timestamps': False},
+    'balanced': {'model': WHISPER_MODEL, 'beam_size': 1, 'word_timestamps': False},
+    'accurate': {'model': WHISPER_MODEL, 'beam_size': WHISPER_BEAM_SIZE, 'word_timestamps': True},
+}
+TRANSCRIBE_PROFILE = "accurate"  # A profile name, or "auto" to pick by Spark length
+
+# For "auto": (minimum seconds, profile), longest first; unknown lengths
+# fall back to the last entry
+AUTO_PROFILE_BY_LENGTH = [(1800, 'fast'), (600, 'balanced'), (0, 'accurate')]
+
+# Decode each Spark once to 16 kHz mono PCM in memory and let Silero VAD drop
+# silent spans before Whisper sees them (replays often sit idle for minutes)
+VAD_FILTER = True
+VAD_MIN_SILENCE_MS = 1000   # silence shorter than this stays in
+VAD_SPEECH_PAD_MS = 200     # padding kept around each speech region
+
+# Whisper's input format
+WHISPER_SAMPLE_RATE = 16000
+
+# Segments are appended here (one JSON line each) as Whisper emits them, so a
+# long transcription is on disk while it runs; the file is removed once the
+# transcript is complete (set to None to disable)
+PARTIAL_TRANSCRIPT_DIR = os.path.join(OUTPUT_DIR, ".catalyst-cache", "partial")
+
+# Seconds between transcription progress lines (audio position, RTF)
+TRANSCRIBE_PROGRESS_SECONDS = 15
+
+# Parallel transcription: worker processes, each loading its own WhisperModel.
+# Keep TRANSCRIBE_WORKERS × WHISPER_CPU_THREADS ≤ CPU cores.
+TRANSCRIBE_WORKERS = 1
+WHISPER_CPU_THREADS = 0  # 0 = split os.cpu_count() evenly across workers
+
+# Persistent transcript cache so re-runs skip Whisper for Sparks already
+# transcribed with the same settings (set to None to disable)
+TRANSCRIPT_CACHE_PATH = os.path.join(OUTPUT_DIR, ".catalyst-cache", "transcripts.sqlite")
+
+# Least-recently-used transcripts are evicted above this size
+TRANSCRIPT_CACHE_MAX_MB = 256
+
+# Manifest of processed Sparks, used by --incremental to skip unchanged files
+MANIFEST_PATH = os.path.join(OUTPUT_DIR, ".catalyst-cache", "manifest.json")
+
+# Bump when prompt or markdown format changes so incremental runs redo everything
+PIPELINE_VERSION = "2.2"
+
+# Where Spark durations come from: "probe" scans the input directory up front
+# (PyAV in-process if installed, else ffprobe), "whisper" skips probing and
+# takes the duration from the audio decoded for transcription
+DURATION_SOURCE = "probe"
+
+# Threads for the up-front duration scan, and where its results are cached
+PROBE_THREADS = 8
+METADATA_CACHE_PATH = os.path.join(OUTPUT_DIR, ".catalyst-cache", "metadata.json")
+
+# Pipeline mode: "serial" runs each Spark end-to-end before starting the next,
+# "staged" overlaps probe → transcribe → analyze → write across Sparks so
+# Whisper (CPU, here) and Mistral (GPU, on wcn-oglaptop) are busy at the same time
+PIPELINE_MODE = "serial"
+
+# Max Sparks waiting between two stages in staged mode (bounds memory use)
+STAGE_QUEUE_SIZE = 4
+
+# End-of-run metrics: JSON summary, plus the same metrics in Prometheus text
+# format alongside it (.prom, for node_exporter's textfile collector).
+# Set to None to skip.
+RUN_METRICS_PATH = os.path.join(OUTPUT_DIR, ".catalyst-cache", "run-metrics.json")
+
+# Pipeline metrics (Whisper inside pool workers is timed by the transcribe stage)
+STAGE_SECONDS = catalyst_metrics.registry.histogram(
+    "catalyst_stage_seconds", "Seconds spent per Spark (or batch) in each pipeline stage")
+SPARKS_TOTAL = catalyst_metrics.registry.counter(
+    "catalyst_sparks_total", "Sparks finished by the pipeline, by outcome")
+ANALYSIS_EVENTS = catalyst_metrics.registry.counter(
+    "catalyst_analysis_events_total", "LLM analysis requests, retries and repairs")
+WHISPER_LOAD_SECONDS = catalyst_metrics.registry.histogram(
+    "catalyst_whisper_load_seconds", "Seconds to load each Whisper model (first one "
+    "includes importing faster-whisper)")
+FIRST_RESULT_SECONDS = catalyst_metrics.registry.histogram(
+    "catalyst_first_result_seconds", "Seconds from start-up until the first Spark was written")
+
+# Start of this run (module import, i.e. process start, unless reset) and
+# when its first Spark was written
+run_clock = {'started': time.perf_counter(), 'first_result': None}
+_run_clock_lock = threading.Lock()
+
 # ============================================================================
 # HELPER FUNCTIONS
 # ============================================================================
@@ -64,9 +247,17 @@ def parse_spark_filename(filename):
 
 def get_video_duration(filepath):
     """
-    Get video duration using ffprobe
+    Get video duration, in-process with PyAV when installed, else via ffprobe
     Returns: duration in seconds (float) or None
     """
+    if av is not None:
+        try:
+            with av.open(str(filepath)) as container:
+                if container.duration:
+                    return container.duration / av.time_base
+        except Exception:
+            pass  # fall through to ffprobe
+    
     try:
         cmd = [
             'ffprobe', '-v', 'error',
@@ -80,118 +271,1232 @@ def get_video_duration(filepath):
         return None
 
 
-def transcribe_spark(filepath, model):
+def scan_spark_metadata(spark_files, cache_path=METADATA_CACHE_PATH, threads=PROBE_THREADS):
+    """
+    Probe durations for a whole directory listing in one pass. Results are
+    cached on disk by (path, size, mtime), so only new or changed files are
+    probed, and those run in parallel threads instead of one at a time.
+    Returns: dict of path string → duration in seconds (None if unknown)
+    """
+    cache_file = Path(cache_path) if cache_path else None
+    cached = {}
+    if cache_file and cache_file.exists():
+        cached = json.loads(cache_file.read_text())
+    
+    durations = {}
+    to_probe = []
+    for spark_file in spark_files:
+        stat = spark_file.stat()
+        entry = cached.get(str(spark_file))
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            durations[str(spark_file)] = entry['duration']
+        else:
+            to_probe.append((spark_file, stat))
+    
+    if to_probe:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            probed = executor.map(get_video_duration, [f for f, _ in to_probe])
+            for (spark_file, stat), duration in zip(to_probe, probed):
+                durations[str(spark_file)] = duration
+                if duration is not None:
+                    cached[str(spark_file)] = {'size': stat.st_size, 'mtime': stat.st_mtime,
+                                               'duration': duration}
+        
+        if cache_file:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = cache_file.with_suffix('.tmp')
+            tmp_file.write_text(json.dumps(cached))
+            os.replace(tmp_file, cache_file)
+    
+    return durations
+
+
+def spark_content_hash(filepath, sample_size=1024 * 1024):
+    """
+    Fast content hash of a media file: file size plus samples from the start,
+    middle and end, so multi-GB replays hash in milliseconds.
+    Returns: hex digest (string)
+    """
+    stat = os.stat(filepath)
+    return _sampled_content_hash(str(filepath), stat.st_size, stat.st_mtime_ns, sample_size)
+
+
+@functools.lru_cache(maxsize=4096)
+def _sampled_content_hash(filepath, size, mtime_ns, sample_size):
+    # size/mtime_ns are part of the memo key so a rewritten file is re-hashed
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    
+    with open(filepath, 'rb') as f:
+        if size <= sample_size * 3:
+            digest.update(f.read())
+        else:
+            for offset in (0, size // 2, size - sample_size):
+                f.seek(offset)
+                digest.update(f.read(sample_size))
+    
+    return digest.hexdigest()
+
+
+def select_profile(profile, duration=None):
+    """
+    Resolve "auto" to a concrete profile using the Spark's length in seconds
+    Returns: profile name (key of TRANSCRIBE_PROFILES)
+    """
+    if profile != "auto":
+        return profile
+    for min_seconds, name in AUTO_PROFILE_BY_LENGTH:
+        if duration is not None and duration >= min_seconds:
+            return name
+    return AUTO_PROFILE_BY_LENGTH[-1][1]
+
+
+def transcription_settings(profile=None):
+    """
+    Whisper settings that affect transcript output
+    profile: name in TRANSCRIBE_PROFILES (default TRANSCRIBE_PROFILE, "auto"
+             resolves as for a Spark of unknown length)
+    Returns: dict (used for model.transcribe and as part of the cache key)
+    """
+    chosen = TRANSCRIBE_PROFILES[select_profile(profile or TRANSCRIBE_PROFILE)]
+    return {
+        'model': chosen['model'],
+        'compute_type': WHISPER_COMPUTE_TYPE,
+        'language': WHISPER_LANGUAGE,
+        'beam_size': chosen['beam_size'],
+        'word_timestamps': chosen['word_timestamps'],
+        'vad_filter': VAD_FILTER,
+        'vad_parameters': {
+            'min_silence_duration_ms': VAD_MIN_SILENCE_MS,
+            'speech_pad_ms': VAD_SPEECH_PAD_MS,
+        } if VAD_FILTER else None,
+    }
+
+
+class TranscriptCache:
+    """
+    Persistent transcript cache backed by SQLite.
+
+    Entries are keyed by the media content hash plus the Whisper settings,
+    so renamed files still hit and a model/setting change misses. Once the
+    stored transcripts exceed max_bytes, least-recently-used entries are evicted.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS transcripts (
+                key TEXT PRIMARY KEY,
+                media_hash TEXT NOT NULL,
+                settings TEXT NOT NULL,
+                transcript TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS transcripts_last_used ON transcripts(last_used);
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+        """)
+        # Caches created before segments were stored only have the text
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(transcripts)")]
+        if 'segments' not in columns:
+            self._conn.execute("ALTER TABLE transcripts ADD COLUMN segments TEXT")
+        if 'duration' not in columns:
+            self._conn.execute("ALTER TABLE transcripts ADD COLUMN duration REAL")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(media_hash, settings):
+        payload = media_hash + json.dumps(settings, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        """
+        Returns: cached (segments, audio duration), as from
+        transcribe_spark_segments, or None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT transcript, segments, duration FROM transcripts WHERE key = ?", (key,)
+            ).fetchone()
+            if row:
+                self.hits += 1
+                self._conn.execute(
+                    "UPDATE transcripts SET last_used = ?, hits = hits + 1 WHERE key = ?",
+                    (time.time(), key)
+                )
+            else:
+                self.misses += 1
+            self._bump("hits" if row else "misses")
+            self._conn.commit()
+        if not row:
+            return None
+        if row[1] is None:
+            return [{'start': 0.0, 'end': 0.0, 'text': row[0]}], row[2]
+        return json.loads(row[1]), row[2]
+
+    def put(self, key, media_hash, settings, segments, duration=None):
+        now = time.time()
+        transcript = join_segments(segments)
+        segments_json = json.dumps(segments)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO transcripts "
+                "(key, media_hash, settings, transcript, segments, duration, "
+                "size, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, media_hash, json.dumps(settings, sort_keys=True), transcript,
+                 segments_json, duration, len(transcript.encode()) + len(segments_json),
+                 now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _bump(self, name):
+        self._conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,)
+        )
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        
+        # Walk from least recently used until we're back under budget
+        doomed = []
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM transcripts ORDER BY last_used ASC"
+        ):
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM transcripts WHERE key = ?", doomed)
+        for _ in doomed:
+            self._bump("evictions")
+
+    def stats(self):
+        """
+        Returns: dict of entry count, size and lifetime hit/miss/eviction counters
+        """
+        with self._lock:
+            entries, size, oldest, newest = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), MIN(last_used), MAX(last_used) "
+                "FROM transcripts"
+            ).fetchone()
+            counters = dict(self._conn.execute("SELECT name, value FROM counters"))
+        return {
+            'entries': entries,
+            'size_bytes': size,
+            'max_bytes': self.max_bytes,
+            'oldest_used': oldest,
+            'newest_used': newest,
+            'hits': counters.get('hits', 0),
+            'misses': counters.get('misses', 0),
+            'evictions': counters.get('evictions', 0),
+        }
+
+
+def open_transcript_cache():
+    """
+    Returns: TranscriptCache, or None if caching is disabled
+    """
+    if not TRANSCRIPT_CACHE_PATH:
+        return None
+    return TranscriptCache(TRANSCRIPT_CACHE_PATH, TRANSCRIPT_CACHE_MAX_MB * 1024 * 1024)
+
+
+def print_cache_stats(cache):
+    """
+    Print the --cache-stats report
+    """
+    stats = cache.stats()
+    lookups = stats['hits'] + stats['misses']
+    hit_rate = stats['hits'] / lookups * 100 if lookups else 0.0
+    
+    def when(ts):
+        return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S') if ts else "-"
+    
+    print(f"🗄️  Transcript cache: {cache.path}")
+    print(f"  Entries:     {stats['entries']}")
+    print(f"  Size:        {stats['size_bytes'] / 1024 / 1024:.1f} MB "
+          f"of {stats['max_bytes'] / 1024 / 1024:.0f} MB")
+    print(f"  Hits/misses: {stats['hits']}/{stats['misses']} ({hit_rate:.1f}% hit rate)")
+    print(f"  Evictions:   {stats['evictions']}")
+    print(f"  Last used:   {when(stats['oldest_used'])} → {when(stats['newest_used'])}")
+
+
+def join_segments(segments):
+    """
+    Returns: full transcript text from a segment list
+    """
+    return " ".join(segment['text'] for segment in segments)
+
+
+def decode_spark_audio(filepath):
+    """
+    Decode a Spark's audio track once, straight to what Whisper consumes
+    Returns: 16 kHz mono float32 numpy array
+    """
+    from faster_whisper import decode_audio
+    return decode_audio(str(filepath), sampling_rate=WHISPER_SAMPLE_RATE)
+
+
+def stream_spark_segments(audio, model, settings):
+    """
+    Transcribe decoded audio, yielding {'start', 'end', 'text'} segment dicts
+    as Whisper produces them and printing progress (audio seconds done,
+    real-time factor) every TRANSCRIBE_PROGRESS_SECONDS
+    """
+    audio_duration = len(audio) / WHISPER_SAMPLE_RATE
+    segments, info = model.transcribe(
+        audio,
+        beam_size=settings['beam_size'],
+        language=settings['language'],
+        word_timestamps=settings['word_timestamps'],
+        vad_filter=settings['vad_filter'],
+        vad_parameters=settings['vad_parameters']
+    )
+    
+    speech_duration = getattr(info, 'duration_after_vad', None)
+    if settings['vad_filter'] and speech_duration is not None:
+        print(f"  🔇 VAD kept {speech_duration:.0f}s of speech from {audio_duration:.0f}s")
+    
+    # Whisper decodes lazily; the work happens as this loop pulls segments
+    started = last_report = time.perf_counter()
+    for segment in segments:
+        yield {'start': round(segment.start, 2), 'end': round(segment.end, 2),
+               'text': segment.text.strip()}
+        
+        now = time.perf_counter()
+        if now - last_report >= TRANSCRIBE_PROGRESS_SECONDS and segment.end > 0:
+            last_report = now
+            print(f"  ⏳ {segment.end:.0f}/{audio_duration:.0f}s audio "
+                  f"({segment.end / audio_duration:.0%}), RTF {(now - started) / segment.end:.2f}")
+
+
+def partial_transcript_path(filepath):
+    """
+    Returns: Path of the in-progress segment file for a Spark, or None if disabled
+    """
+    if not PARTIAL_TRANSCRIPT_DIR:
+        return None
+    return Path(PARTIAL_TRANSCRIPT_DIR) / f"{Path(filepath).stem}.jsonl"
+
+
+def transcribe_spark_segments(filepath, models, cache=None, profile=None, on_segment=None):
+    """
+    Use faster-whisper to transcribe audio/video
+    Checks the transcript cache first when one is given, then decodes the
+    audio once; with VAD_FILTER only speech regions reach the model
+    (segment timestamps still refer to the original audio). Segments are
+    spooled to PARTIAL_TRANSCRIPT_DIR and passed to on_segment as they arrive
+    (not on a cache hit).
+    models: WhisperModels supplying the profile's model
+    Returns: (list of {'start', 'end', 'text'} segment dicts in seconds,
+              audio duration in seconds as decoded by Whisper, or None)
+    """
+    settings = transcription_settings(profile)
+    
+    if cache is not None:
+        media_hash = spark_content_hash(filepath)
+        cache_key = TranscriptCache.make_key(media_hash, settings)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            print(f"  ⚡ Transcript cache hit ({len(join_segments(cached[0]))} chars)")
+            return cached
+    
+    print(f"  🎤 Transcribing with faster-whisper ({settings['model']}, "
+          f"beam {settings['beam_size']})...")
+    model = models.get(settings['model'])
+    
+    # Decode once; the buffer also gives the exact duration, no probe needed
+    audio = decode_spark_audio(filepath)
+    audio_duration = len(audio) / WHISPER_SAMPLE_RATE
+    
+    spool_path = partial_transcript_path(filepath)
+    spool = None
+    if spool_path:
+        spool_path.parent.mkdir(parents=True, exist_ok=True)
+        spool = open(spool_path, "w", encoding="utf-8")
+    
+    # Keep segment boundaries; long Sparks are chunked along them for analysis
+    segments = []
+    try:
+        for segment in stream_spark_segments(audio, model, settings):
+            segments.append(segment)
+            if spool:
+                spool.write(json.dumps(segment) + "\n")
+                spool.flush()
+            if on_segment:
+                on_segment(segment)
+    finally:
+        if spool:
+            spool.close()
+    del audio
+    if spool_path:
+        spool_path.unlink()
+    
+    if cache is not None:
+        cache.put(cache_key, media_hash, settings, segments, audio_duration)
+    
+    print(f"  ✓ Transcription complete ({len(join_segments(segments))} chars, "
+          f"{len(segments)} segments)")
+    return segments, audio_duration
+
+
+def transcribe_spark(filepath, models, cache=None, profile=None):
     """
     Use faster-whisper to transcribe audio/video
     Returns: transcript text (string)
     """
-    print(f"  🎤 Transcribing with faster-whisper...")
+    segments, _ = transcribe_spark_segments(filepath, models, cache, profile)
+    return join_segments(segments)
+
+
+# Static instructions shared by every Spark. They come first so consecutive
+# prompts share one long identical prefix, which Ollama can reuse from its
+# KV cache; only the transcript part below differs from Spark to Spark.
+ANALYSIS_INSTRUCTIONS = """Analyze personal development voice notes according to the Evolutions Methodology.
+
+ANALYSIS FRAMEWORK:
+- Categories: methodology, product-strategy, fitness, mental-health, technical, business
+- Evolution Phase: Which part of the system is being developed (catalyst, spark-app, clipboard, ditl)
+- Insight Type: connection, obstacle, decision, question, breakthrough, reflection
+- Energy Level: high, medium, low, frustrated, excited, contemplative
+- Actionable: Does this contain a specific task or decision? (true/false)
+- Key Concepts: Extract 3-5 main concepts or terms mentioned
+
+Respond ONLY with valid JSON in this exact format:
+{
+    "category": ["list", "of", "categories"],
+    "evolution_phase": "phase-name",
+    "insight_type": "type",
+    "energy": "level",
+    "actionable": true,
+    "key_concepts": ["concept1", "concept2", "concept3"],
+    "summary": "One sentence summary of the core insight",
+    "methodology_alignment": "How this relates to Evolutions framework"
+}"""
+
+# Per-Spark part; {transcript} is filled per Spark (plain str.replace)
+ANALYSIS_TRANSCRIPT_TEMPLATE = """VOICE NOTE TRANSCRIPT:
+{transcript}
+
+Respond ONLY with the JSON analysis of this voice note."""
+
+# Whole prompt, for when the instructions aren't sent as a template
+ANALYSIS_PROMPT_TEMPLATE = ANALYSIS_INSTRUCTIONS + "\n\n" + ANALYSIS_TRANSCRIPT_TEMPLATE
+
+
+# JSON schema for the analysis object (used with STRUCTURED_ANALYSIS)
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "category": {
+            "type": "array",
+            "items": {"type": "string", "enum": [
+                "methodology", "product-strategy", "fitness",
+                "mental-health", "technical", "business"
+            ]}
+        },
+        "evolution_phase": {"type": "string"},
+        "insight_type": {"type": "string", "enum": [
+            "connection", "obstacle", "decision", "question", "breakthrough", "reflection"
+        ]},
+        "energy": {"type": "string", "enum": [
+            "high", "medium", "low", "frustrated", "excited", "contemplative"
+        ]},
+        "actionable": {"type": "boolean"},
+        "key_concepts": {"type": "array", "items": {"type": "string"}},
+        "summary": {"type": "string"},
+        "methodology_alignment": {"type": "string"}
+    },
+    "required": [
+        "category", "evolution_phase", "insight_type", "energy",
+        "actionable", "key_concepts", "summary", "methodology_alignment"
+    ]
+}
+
+# Run-wide analysis counters (requests, whole-generation retries after bad
+# JSON, gateway field repairs), printed at the end of a run
+analysis_stats = collections.Counter()
+_analysis_stats_lock = threading.Lock()
+
+
+def count_analysis(name, amount=1):
+    with _analysis_stats_lock:
+        analysis_stats[name] += amount
+    ANALYSIS_EVENTS.inc(amount, event=name)
+
+
+def build_analysis_prompt(transcript):
+    """
+    Returns: the full analysis prompt for one transcript
+    """
+    return ANALYSIS_PROMPT_TEMPLATE.replace("{transcript}", transcript)
+
+
+class RetryableError(Exception):
+    """
+    A gateway failure worth retrying (timeout, dropped connection, 5xx, 429),
+    or an answer worth asking for again (fields still missing);
+    retry_after is the gateway's Retry-After in seconds, if it sent one
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TemplateForgotten(Exception):
+    """
+    The gateway answered 404 "unknown template": it restarted and lost the
+    registered analysis template
+    """
+
+
+class RequestRejected(Exception):
+    """
+    The gateway rejected the request itself (4xx other than 429); sending
+    it again won't help
+    """
+
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code}")
+        self.response = response
+
+
+# HTTP statuses that mean "try again later" rather than "this request is wrong"
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# Shared by every thread: one pool of keep-alive connections to the gateway
+_gateway_session = None
+_gateway_session_lock = threading.Lock()
+
+# Held for each analysis attempt, so no more than ANALYSIS_IN_FLIGHT
+# requests are at the gateway whichever thread sends them
+_analysis_slots = threading.BoundedSemaphore(ANALYSIS_IN_FLIGHT)
+
+
+def gateway_session():
+    """
+    Returns: the process-wide requests.Session for gateway calls
+    """
+    global _gateway_session
+    with _gateway_session_lock:
+        if _gateway_session is None:
+            _gateway_session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4,
+                                                    pool_maxsize=ANALYSIS_IN_FLIGHT + 2)
+            _gateway_session.mount("http://", adapter)
+            _gateway_session.mount("https://", adapter)
+        return _gateway_session
+
+
+def gateway_post(url, body, read_timeout=None, stream=False):
+    """
+    POST JSON to the gateway over a pooled keep-alive connection
+    Returns: the response (any status that isn't worth retrying)
+    Raises: RetryableError for timeouts, connection failures and RETRYABLE_STATUSES
+    """
+    try:
+        response = gateway_session().post(
+            url, json=body, stream=stream,
+            timeout=(GATEWAY_CONNECT_TIMEOUT, read_timeout or GATEWAY_READ_TIMEOUT),
+        )
+    except (requests.ConnectionError, requests.Timeout) as e:
+        raise RetryableError(f"{type(e).__name__}: {e}") from e
+    
+    if response.status_code in RETRYABLE_STATUSES:
+        retry_after = response.headers.get('Retry-After')
+        response.close()
+        raise RetryableError(
+            "gateway busy" if response.status_code == 429 else f"HTTP {response.status_code}",
+            int(retry_after) if retry_after and retry_after.isdigit() else None,
+        )
+    return response
+
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Returns: seconds to wait before retry number attempt + 1: the gateway's
+    Retry-After if given, else "full jitter" exponential backoff, so
+    concurrent analyses that failed together don't retry in lockstep
+    """
+    if retry_after is not None:
+        return retry_after + random.uniform(0, RETRY_BACKOFF_BASE)
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** (attempt + 1)))
+
+
+def wait_before_retry(attempt, retry_count, retry_after=None, retried=1):
+    """
+    Sleep before the next attempt (if there is one); only this analysis
+    waits, other in-flight ones carry on. `retried` analyses are counted as
+    full retries, unless the gateway was just busy (retry_after).
+    """
+    if attempt >= retry_count - 1:
+        return
+    if retry_after is None:
+        count_analysis('full_retries', retried)
+    wait_time = backoff_delay(attempt, retry_after)
+    print(f"  ⏳ Waiting {wait_time:.1f}s before retry...")
+    time.sleep(wait_time)
+
+
+# Gateway template id for ANALYSIS_INSTRUCTIONS, registered on first use
+_analysis_template = {'id': None}
+_analysis_template_lock = threading.Lock()
+
+
+def analysis_template_id(refresh=False):
+    """
+    Register ANALYSIS_INSTRUCTIONS with the gateway (once per run, or again
+    with refresh=True after the gateway forgot it)
+    Returns: template id, or None to fall back to whole prompts
+    """
+    if not PREFIX_TEMPLATE:
+        return None
+    with _analysis_template_lock:
+        if _analysis_template['id'] is None or refresh:
+            try:
+                response = gateway_post(OLLAMA_TEMPLATES_ENDPOINT,
+                                        {"system": ANALYSIS_INSTRUCTIONS}, read_timeout=10)
+                response.raise_for_status()
+                _analysis_template['id'] = response.json()['template']
+            except (RetryableError, requests.RequestException, ValueError, KeyError) as e:
+                print(f"  ⚠ Could not register analysis template, sending whole prompts: {e}")
+                return None
+        return _analysis_template['id']
+
+
+def with_analysis_prompt(body, transcript, template):
+    """
+    Returns: request body with the prompt for one transcript, either the
+    transcript part plus the template id or the whole prompt
+    """
+    if template:
+        return dict(body, template=template,
+                    prompt=ANALYSIS_TRANSCRIPT_TEMPLATE.replace("{transcript}", transcript))
+    return dict(body, prompt=build_analysis_prompt(transcript))
+
+
+def template_forgotten(response):
+    """
+    Returns: True if the gateway answered 404 "unknown template" (it restarted)
+    """
+    if response.status_code != 404:
+        return False
+    try:
+        return response.json().get('error') == 'unknown template'
+    except ValueError:
+        return False
+
+
+def require_ok(response):
+    """
+    Raises: TemplateForgotten or RequestRejected unless the gateway answered 200
+    """
+    if response.status_code == 200:
+        return
+    if template_forgotten(response):
+        raise TemplateForgotten()
+    raise RequestRejected(response)
+
+
+def retry_analysis(attempt_once, retry_count=3, template=None, what="Analysis",
+                   retried=lambda: 1, debug=False):
+    """
+    Run attempt_once(attempt, template) until it returns, under the one
+    retry policy for gateway analysis calls. Each attempt takes one of the
+    ANALYSIS_IN_FLIGHT slots (backoff waits don't). RetryableError, dropped
+    connections and unparseable output wait (jittered backoff, or the
+    gateway's Retry-After) and try again; a forgotten template is
+    re-registered and retried straight away; a rejected request or any
+    other error gives up
+    retried: how many analyses the next attempt re-sends (for the counters)
+    Returns: attempt_once's result, or None if every attempt failed
+    """
+    for attempt in range(retry_count):
+        count_analysis('requests', retried())
+        retry_after = None
+        try:
+            with _analysis_slots:
+                return attempt_once(attempt, template)
+
+        except TemplateForgotten:
+            print(f"  ⚠ Attempt {attempt+1}: gateway restarted, re-registering template")
+            template = analysis_template_id(refresh=True)
+            continue
+        except RequestRejected as e:
+            print(f"  ❌ {what} failed: {e}")
+            if debug:
+                print(f"  [DEBUG] Response body: {e.response.text}")
+            return None
+        except RetryableError as e:
+            print(f"  ⚠ Attempt {attempt+1} failed: {e}")
+            retry_after = e.retry_after
+        except json.JSONDecodeError as e:
+            print(f"  ⚠ Attempt {attempt+1} failed: Invalid JSON - {str(e)}")
+            count_analysis('json_failures')
+        except (requests.RequestException, ValueError) as e:
+            # e.g. the connection dropped mid-stream
+            print(f"  ⚠ Attempt {attempt+1} failed: {str(e)}")
+        except Exception as e:
+            print(f"  ❌ {what} failed: {str(e)}")
+            return None
+
+        wait_before_retry(attempt, retry_count, retry_after, retried=retried())
+
+    print(f"  ❌ {what} failed after {retry_count} attempts")
+    return None
+
+
+def parse_analysis_output(llm_output):
+    """
+    Parse the LLM's analysis JSON, stripping markdown code fences
+    Mistral sometimes wraps JSON in markdown code blocks
+    Returns: analysis dict (raises json.JSONDecodeError if malformed)
+    """
+    llm_output = re.sub(r'^```json\s*', '', llm_output.strip())
+    llm_output = re.sub(r'\s*```$', '', llm_output)
+    return json.loads(llm_output.strip())
+
+
+class JsonObjectScanner:
+    """
+    Incrementally scans streamed LLM text for the first complete top-level
+    JSON object, tracking brace depth outside of strings. Lets a streamed
+    analysis be cut off the moment its closing brace arrives.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk):
+        """
+        Returns: the complete JSON object text once closed, else None
+        """
+        offset = len(self.text)
+        self.text += chunk
+        
+        for i in range(offset, len(self.text)):
+            char = self.text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"' and self._start is not None:
+                self._in_string = True
+            elif char == '{':
+                if self._start is None:
+                    self._start = i
+                self._depth += 1
+            elif char == '}' and self._start is not None:
+                self._depth -= 1
+                if self._depth == 0:
+                    return self.text[self._start:i + 1]
+        return None
+
+
+def read_streamed_analysis(response, debug=False):
+    """
+    Consume the gateway's NDJSON token stream until the analysis object closes
+    Returns: JSON object text (or everything received if it never closed)
+    """
+    scanner = JsonObjectScanner()
+    try:
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if 'error' in chunk:
+                # e.g. lost the race for the gateway queue after admission
+                raise RetryableError(f"gateway stream error: {chunk['error']}",
+                                     chunk.get('retry_after'))
+            
+            complete = scanner.feed(chunk.get('response', ''))
+            if complete is not None:
+                if debug and not chunk.get('done'):
+                    print(f"  [DEBUG] JSON closed after {len(scanner.text)} chars, "
+                          f"dropping rest of stream")
+                return complete
+            if chunk.get('done'):
+                break
+    finally:
+        # Closing early disconnects the gateway, which stops Ollama generating
+        response.close()
+    return scanner.text
+
+
+def analyze_structured(transcript, retry_count=3, debug=False):
+    """
+    Schema-constrained analysis: the gateway generates against ANALYSIS_SCHEMA,
+    validates the result and re-asks only for missing/invalid fields
+    Returns: analysis dict or None if failed
+    """
+    print(f"  🧠 Analyzing with Mistral (structured)...")
+    
+    def attempt_once(attempt, template):
+        response = gateway_post(
+            OLLAMA_ANALYZE_ENDPOINT,
+            with_analysis_prompt({
+                "model": "mistral",
+                "schema": ANALYSIS_SCHEMA,
+                "priority": "batch",
+                "cache": USE_GATEWAY_CACHE and attempt == 0
+            }, transcript, template),
+            # first generation plus the gateway's field repairs
+            read_timeout=GATEWAY_READ_TIMEOUT * (1 + STRUCTURED_REPAIR_ATTEMPTS)
+        )
+        
+        if debug:
+            print(f"\n  [DEBUG] Status Code: {response.status_code}")
+            print(f"  [DEBUG] Raw response: {response.text[:500]}")
+        
+        require_ok(response)
+        result = response.json()
+        count_analysis('field_repairs', result.get('repairs', 0))
+        if not result.get('valid'):
+            raise RetryableError(f"still missing {', '.join(result.get('missing', []))}")
+        print(f"  ✓ Analysis complete"
+              + (f" ({result['repairs']} field repairs)" if result.get('repairs') else ""))
+        return result['data']
+    
+    return retry_analysis(attempt_once, retry_count, analysis_template_id(), debug=debug)
+
+
+def analyze_with_mistral(transcript, retry_count=3, debug=False, stream=None, structured=None):
+    """
+    Send transcript to Ollama via FastAPI for LLM analysis
+    Returns: analysis dict or None if failed
+    
+    Reuses pooled keep-alive connections; timeouts, dropped connections,
+    5xx, 429 and unparseable output are retried with jittered backoff, other
+    HTTP errors fail straight away
+    With stream=True (default: STREAM_ANALYSIS), tokens are read as they
+    arrive and the request is dropped once the JSON object is complete
+    With structured=True (default: STRUCTURED_ANALYSIS), see analyze_structured
+    """
+    if structured is None:
+        structured = STRUCTURED_ANALYSIS
+    if structured:
+        return analyze_structured(transcript, retry_count, debug)
+    if stream is None:
+        stream = STREAM_ANALYSIS
+    
+    print(f"  🧠 Analyzing with Mistral...")
+    
+    # Build the prompt for structured analysis
+    prompt = build_analysis_prompt(transcript)
+    # With a registered template the instructions go once, as a reusable
+    # prefix, and requests go to /api/analyze; without one, whole prompts
+    # go to /api/review
+    template = analysis_template_id()
+
+    def attempt_once(attempt, template):
+        if stream:
+            # Read timeout applies per token batch, not to the whole generation
+            response = gateway_post(
+                OLLAMA_ANALYZE_ENDPOINT,
+                with_analysis_prompt({
+                    "model": "mistral",
+                    "priority": "batch",
+                    "stream": True,
+                    "cache": USE_GATEWAY_CACHE and attempt == 0
+                }, transcript, template),
+                stream=True
+            )
+        elif template:
+            response = gateway_post(
+                OLLAMA_ANALYZE_ENDPOINT,
+                with_analysis_prompt({
+                    "model": "mistral",
+                    "priority": "batch",
+                    "cache": USE_GATEWAY_CACHE and attempt == 0
+                }, transcript, template)
+            )
+        else:
+            response = gateway_post(
+                OLLAMA_ENDPOINT,
+                {
+                    "text": prompt,
+                    "model": "mistral",
+                    "priority": "batch",  # let interactive requests jump the gateway queue
+                    "cache": USE_GATEWAY_CACHE and attempt == 0
+                }
+            )
+        
+        if debug:
+            print(f"\n  [DEBUG] Status Code: {response.status_code}")
+            if not stream:
+                print(f"  [DEBUG] Raw response: {response.text[:500]}")
+        
+        require_ok(response)
+        if stream:
+            llm_output = read_streamed_analysis(response, debug)
+        else:
+            result = response.json()
+            
+            # Try to parse the LLM response as JSON
+            # Mistral sometimes wraps JSON in markdown code blocks
+            llm_output = result.get('response', result.get('text', ''))
+        
+        if debug:
+            print(f"  [DEBUG] LLM output (first 500 chars): {llm_output[:500]}")
+        
+        # Strip markdown code blocks if present
+        try:
+            analysis = parse_analysis_output(llm_output)
+        except json.JSONDecodeError:
+            if debug:
+                print(f"  [DEBUG] Attempted to parse: {llm_output[:500]}")
+            raise
+        print(f"  ✓ Analysis complete")
+        return analysis
+    
+    # Retry logic with jittered exponential backoff
+    return retry_analysis(attempt_once, retry_count, template, debug=debug)
+
+
+def analyze_batch_with_mistral(transcripts, retry_count=3, debug=False):
+    """
+    Analyze several transcripts in one request to the gateway's batch endpoint
+    (shared instruction block, one tunnel round-trip per batch)
+    transcripts: dict of id → transcript text
+    Returns: dict of id → analysis dict (or None if that item failed)
+    
+    Items that fail (bad JSON, item errors) or a batch that fails retryably
+    (timeout, 5xx, 429) are re-sent together on the next attempt
+    """
+    print(f"  🧠 Analyzing batch of {len(transcripts)} with Mistral...")
+    
+    analyses = {spark_id: None for spark_id in transcripts}
+    pending = list(transcripts)
+    
+    def attempt_once(attempt, template):
+        nonlocal pending
+        request = {
+            "instructions": ANALYSIS_PROMPT_TEMPLATE,
+            "items": [{"id": spark_id, "text": transcripts[spark_id]}
+                      for spark_id in pending],
+            "model": "mistral",
+            "cache": USE_GATEWAY_CACHE and attempt == 0
+        }
+        if template:
+            request.update(instructions=ANALYSIS_TRANSCRIPT_TEMPLATE, template=template)
+        if STRUCTURED_ANALYSIS:
+            request["schema"] = ANALYSIS_SCHEMA
+        response = gateway_post(
+            OLLAMA_BATCH_ENDPOINT,
+            request,
+            # items run one after another on the GPU, each with its
+            # field repairs in structured mode
+            read_timeout=GATEWAY_READ_TIMEOUT * len(pending)
+            * ((1 + STRUCTURED_REPAIR_ATTEMPTS) if STRUCTURED_ANALYSIS else 1)
+        )
+        
+        if debug:
+            print(f"\n  [DEBUG] Status Code: {response.status_code}")
+        
+        require_ok(response)
+        for item in response.json().get('results', []):
+            if 'error' in item:
+                print(f"  ⚠ {item['id']}: {item['error']}")
+                continue
+            if 'data' in item:
+                # Structured mode: already parsed and validated by the gateway
+                count_analysis('field_repairs', item.get('repairs', 0))
+                if item.get('valid'):
+                    analyses[item['id']] = item['data']
+                else:
+                    print(f"  ⚠ {item['id']}: still missing {', '.join(item['missing'])}")
+                continue
+            try:
+                analyses[item['id']] = parse_analysis_output(item['response'])
+            except json.JSONDecodeError as e:
+                print(f"  ⚠ {item['id']}: Invalid JSON - {str(e)}")
+                count_analysis('json_failures')
+                if debug:
+                    print(f"  [DEBUG] Attempted to parse: {item['response'][:500]}")
+        
+        pending = [spark_id for spark_id in pending if analyses[spark_id] is None]
+        if pending:
+            raise RetryableError(f"{len(pending)} of batch need retry")
+        return analyses
+    
+    retry_analysis(attempt_once, retry_count, analysis_template_id(), what="Batch",
+                   retried=lambda: len(pending), debug=debug)
+    
+    done = sum(1 for analysis in analyses.values() if analysis)
+    print(f"  ✓ Batch analysis complete ({done}/{len(transcripts)})")
+    return analyses
+
+
+# Final step of map-reduce: one short call to merge the chunk summaries
+REDUCE_PROMPT_TEMPLATE = """These are summaries of consecutive parts of one personal development voice note, analyzed according to the Evolutions Methodology.
+
+PART SUMMARIES:
+{summaries}
+
+Combine them into a single analysis of the whole voice note.
+Respond ONLY with valid JSON in this exact format:
+{
+    "summary": "One sentence summary of the core insight",
+    "methodology_alignment": "How this relates to Evolutions framework"
+}"""
+
+
+def estimate_tokens(text):
+    """
+    Rough Mistral token count without loading a tokenizer: English runs
+    ~4 chars or ~0.75 words per token; take the larger estimate
+    Returns: int
+    """
+    return int(max(len(text) / 4, len(text.split()) * 1.3))
+
+
+def chunk_segments(segments, max_tokens):
+    """
+    Group consecutive Whisper segments into windows of at most ~max_tokens
+    (a single over-long segment gets a window to itself)
+    Returns: list of segment lists
+    """
+    chunks = []
+    current = []
+    current_tokens = 0
+    for segment in segments:
+        tokens = estimate_tokens(segment['text'])
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(current)
+            current = []
+            current_tokens = 0
+        current.append(segment)
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def most_common(values, limit=None):
+    """
+    Returns: values ordered by frequency (first-seen order breaks ties)
+    """
+    return [value for value, _ in collections.Counter(values).most_common(limit)]
+
+
+def request_json_completion(prompt, retry_count=3, debug=False):
+    """
+    Send a raw prompt to the gateway and parse the JSON object it returns
+    Returns: dict or None if failed
+    """
+    def attempt_once(attempt, template):
+        response = gateway_post(
+            OLLAMA_ANALYZE_ENDPOINT,
+            {"prompt": prompt, "model": "mistral", "priority": "batch",
+             "cache": USE_GATEWAY_CACHE and attempt == 0}
+        )
+        require_ok(response)
+        return parse_analysis_output(response.json().get('response', ''))
+    
+    return retry_analysis(attempt_once, retry_count, what="Request", debug=debug)
+
+
+def chunk_text(index, chunk):
+    """
+    Returns: chunk transcript labelled with its position in the Spark
+    """
+    start = int(chunk[0]['start'])
+    return f"[Part {index + 1}, from {start // 60}:{start % 60:02d}] {join_segments(chunk)}"
+
+
+class EarlyMapAnalysis:
+    """
+    Map step for a long Spark that starts while it is still being transcribed.
+    Segments are grouped exactly as chunk_segments would; once the running
+    transcript is past SINGLE_SHOT_MAX_TOKENS every finished chunk is sent
+    to Mistral in the background, and analyze_spark picks up the results.
+    Requests count against the same ANALYSIS_IN_FLIGHT limit as the analyze
+    stage, so starting early never puts extra work in the gateway's queue.
+    """
+
+    def __init__(self, debug=False):
+        self.debug = debug
+        self.chunks = []
+        self._current = []
+        self._current_tokens = 0
+        self._total_tokens = 0
+        self._futures = []
+        self._executor = None
+
+    def add(self, segment):
+        tokens = estimate_tokens(segment['text'])
+        if self._current and self._current_tokens + tokens > ANALYSIS_CHUNK_TOKENS:
+            self.chunks.append(self._current)
+            self._current = []
+            self._current_tokens = 0
+        self._current.append(segment)
+        self._current_tokens += tokens
+        self._total_tokens += tokens
+        
+        if self._total_tokens > SINGLE_SHOT_MAX_TOKENS:
+            self._submit_finished()
+
+    def _submit_finished(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=ANALYSIS_IN_FLIGHT)
+            print(f"  🚀 Long Spark: starting analysis while transcription continues")
+        while len(self._futures) < len(self.chunks):
+            index = len(self._futures)
+            self._futures.append(self._executor.submit(
+                analyze_with_mistral, chunk_text(index, self.chunks[index]), debug=self.debug))
+
+    def collect(self, chunks):
+        """
+        Wait for the chunks already sent; only the leading chunks that match
+        the final chunking count (nothing is reused after a cache hit)
+        Returns: list of analyses (None for failed ones), one per reused chunk
+        """
+        results = []
+        for index, future in enumerate(self._futures):
+            if index >= len(chunks) or chunks[index] != self.chunks[index]:
+                break
+            results.append(future.result())
+        self.close()
+        return results
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Chunk analysis fields merged by frequency (lists) or by vote (single values)
+LIST_FIELDS = ('category', 'key_concepts')
+SINGLE_FIELDS = ('evolution_phase', 'insight_type', 'energy', 'summary', 'methodology_alignment')
+
+
+def normalize_partial(partial):
+    """
+    Coerce one chunk's analysis to the shapes the reduce step expects:
+    list fields become lists of strings, single-valued fields strings.
+    Mistral sometimes answers "category": "technical" or
+    "evolution_phase": ["awareness"]; values that can't be coerced
+    (objects, nested lists) are dropped.
+    Returns: normalized copy
+    """
+    def scalar(value):
+        if isinstance(value, str):
+            return value
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        return None
+    
+    normalized = dict(partial)
+    for field in LIST_FIELDS:
+        value = partial.get(field)
+        values = value if isinstance(value, list) else [value]
+        normalized[field] = [text for text in map(scalar, values) if text]
+    for field in SINGLE_FIELDS:
+        value = partial.get(field)
+        if isinstance(value, list):
+            # A one-value field answered as a list: take its first usable entry
+            value = next((text for text in map(scalar, value) if text), None)
+        normalized[field] = scalar(value)
+    return normalized
+
+
+def analyze_map_reduce(chunks, debug=False, early=None):
+    """
+    Map: analyze each chunk concurrently via the gateway's batch endpoint
+    (leading chunks already sent by an EarlyMapAnalysis are reused).
+    Reduce: merge list fields by frequency, vote on the single-valued
+    fields, and ask Mistral for one summary of the chunk summaries.
+    Returns: analysis dict or None if every chunk failed
+    """
+    mapped = early.collect(chunks) if early is not None else []
+    if mapped:
+        print(f"  ⚡ {len(mapped)}/{len(chunks)} chunks analyzed during transcription")
+    transcripts = {str(i): chunk_text(i, chunks[i]) for i in range(len(mapped), len(chunks))}
+    if transcripts:
+        results = analyze_batch_with_mistral(transcripts, debug=debug)
+        mapped += [results.get(str(i)) for i in range(len(mapped), len(chunks))]
+    partials = [normalize_partial(analysis) for analysis in mapped
+                if isinstance(analysis, dict) and analysis]
+    if not partials:
+        return None
     
-    # Transcribe with word-level timestamps
-    segments, info = model.transcribe(
-        str(filepath),
-        beam_size=5,
-        language="en",  # Force English, or use None for auto-detect
-        word_timestamps=True
-    )
+    def vote(field, default='unknown'):
+        values = [p[field] for p in partials if p.get(field)]
+        return most_common(values, 1)[0] if values else default
+    
+    analysis = {
+        'category': most_common(c for p in partials for c in p['category']),
+        'evolution_phase': vote('evolution_phase'),
+        'insight_type': vote('insight_type'),
+        'energy': vote('energy'),
+        'actionable': any(p.get('actionable') for p in partials),
+        'key_concepts': most_common((k for p in partials for k in p['key_concepts']), 5),
+    }
     
-    # Combine all segments into full transcript
-    transcript = " ".join([segment.text.strip() for segment in segments])
+    summaries = [p.get('summary', '') for p in partials if p.get('summary')]
+    merged = request_json_completion(
+        REDUCE_PROMPT_TEMPLATE.replace("{summaries}",
+                                       "\n".join(f"- {summary}" for summary in summaries)),
+        debug=debug
+    ) or {}
+    analysis['summary'] = merged.get('summary') or " ".join(summaries)
+    analysis['methodology_alignment'] = (
+        merged.get('methodology_alignment')
+        or vote('methodology_alignment', 'Not analyzed')
+    )
     
-    print(f"  ✓ Transcription complete ({len(transcript)} chars)")
-    return transcript
+    print(f"  ✓ Map-reduce analysis complete ({len(partials)}/{len(chunks)} chunks)")
+    return analysis
 
 
-def analyze_with_mistral(transcript, retry_count=3, debug=False):
+def analyze_spark(segments, debug=False, early=None):
     """
-    Send transcript to Ollama via FastAPI for LLM analysis
+    Analyze a transcript, choosing single-shot or map-reduce by estimated length
+    early: EarlyMapAnalysis fed during transcription, if any
     Returns: analysis dict or None if failed
-    
-    Uses exponential backoff retry logic for connection issues
     """
-    print(f"  🧠 Analyzing with Mistral...")
+    transcript = join_segments(segments)
+    tokens = estimate_tokens(transcript)
+    if tokens <= SINGLE_SHOT_MAX_TOKENS:
+        if early is not None:
+            early.close()
+        return analyze_with_mistral(transcript, debug=debug)
     
-    # Build the prompt for structured analysis
-    prompt = f"""Analyze this personal development voice note according to the Evolutions Methodology.
-
-VOICE NOTE TRANSCRIPT:
-{transcript}
-
-ANALYSIS FRAMEWORK:
-- Categories: methodology, product-strategy, fitness, mental-health, technical, business
-- Evolution Phase: Which part of the system is being developed (catalyst, spark-app, clipboard, ditl)
-- Insight Type: connection, obstacle, decision, question, breakthrough, reflection
-- Energy Level: high, medium, low, frustrated, excited, contemplative
-- Actionable: Does this contain a specific task or decision? (true/false)
-- Key Concepts: Extract 3-5 main concepts or terms mentioned
+    chunks = chunk_segments(segments, ANALYSIS_CHUNK_TOKENS)
+    print(f"  ✂️  Long Spark (~{tokens} tokens): map-reduce over {len(chunks)} chunks")
+    return analyze_map_reduce(chunks, debug, early)
 
-Respond ONLY with valid JSON in this exact format:
-{{
-    "category": ["list", "of", "categories"],
-    "evolution_phase": "phase-name",
-    "insight_type": "type",
-    "energy": "level",
-    "actionable": true,
-    "key_concepts": ["concept1", "concept2", "concept3"],
-    "summary": "One sentence summary of the core insight",
-    "methodology_alignment": "How this relates to Evolutions framework"
-}}"""
 
-    # Retry logic with exponential backoff (from your existing code)
-    for attempt in range(retry_count):
-        try:
-            response = requests.post(
-                OLLAMA_ENDPOINT,
-                json={
-                    "text": prompt,
-                    "model": "mistral"
-                },
-                timeout=60  # 60 second timeout per request
-            )
-            
-            if debug:
-                print(f"\n  [DEBUG] Status Code: {response.status_code}")
-                print(f"  [DEBUG] Raw response: {response.text[:500]}")
-            
-            if response.status_code == 200:
-                result = response.json()
-                
-                # Try to parse the LLM response as JSON
-                # Mistral sometimes wraps JSON in markdown code blocks
-                llm_output = result.get('response', result.get('text', ''))
-                
-                if debug:
-                    print(f"  [DEBUG] LLM output (first 500 chars): {llm_output[:500]}")
-                
-                # Strip markdown code blocks if present
-                llm_output = re.sub(r'^```json\s*', '', llm_output)
-                llm_output = re.sub(r'\s*```$', '', llm_output)
-                llm_output = llm_output.strip()
-                
-                analysis = json.loads(llm_output)
-                print(f"  ✓ Analysis complete")
-                return analysis
-            
-            else:
-                print(f"  ⚠ Attempt {attempt+1} failed: HTTP {response.status_code}")
-                if debug:
-                    print(f"  [DEBUG] Response body: {response.text}")
-                
-        except json.JSONDecodeError as e:
-            print(f"  ⚠ Attempt {attempt+1} failed: Invalid JSON - {str(e)}")
-            if debug:
-                print(f"  [DEBUG] Attempted to parse: {llm_output[:500] if 'llm_output' in locals() else 'N/A'}")
-        except Exception as e:
-            print(f"  ⚠ Attempt {attempt+1} failed: {str(e)}")
-        
-        # Wait before retry (exponential backoff: 1s, 2s, 4s)
-        if attempt < retry_count - 1:
-            wait_time = 2 ** attempt
-            print(f"  ⏳ Waiting {wait_time}s before retry...")
-            time.sleep(wait_time)
-    
-    print(f"  ❌ Analysis failed after {retry_count} attempts")
-    return None
+def format_duration(duration):
+    """
+    Returns: "12.3s", or "unknown" when no duration could be determined
+    """
+    return f"{duration:.1f}s" if duration is not None else "unknown"
 
 
 def generate_spark_markdown(spark_data, output_dir):
@@ -206,7 +1511,7 @@ def generate_spark_markdown(spark_data, output_dir):
     # Build YAML frontmatter
     frontmatter = f"""---
 timestamp: {timestamp.isoformat()}
-duration: {spark_data['duration']:.1f}s
+duration: {format_duration(spark_data['duration'])}
 spark_id: {spark_data['spark_id']}
 original_file: {spark_data['original_filename']}
 category: {json.dumps(spark_data['analysis'].get('category', []))}
@@ -240,6 +1545,7 @@ key_concepts: {json.dumps(spark_data['analysis'].get('key_concepts', []))}
     filepath.parent.mkdir(parents=True, exist_ok=True)
     filepath.write_text(frontmatter)
     print(f"  📝 Written: {filename}")
+    return filepath
 
 
 def generate_index_report(all_sparks, output_dir):
@@ -248,7 +1554,10 @@ def generate_index_report(all_sparks, output_dir):
     """
     # Calculate summary stats
     total_sparks = len(all_sparks)
-    total_duration = sum(s['duration'] for s in all_sparks)
+    # Sparks with unknown duration are left out rather than guessed
+    known_durations = [s['duration'] for s in all_sparks if s['duration'] is not None]
+    total_duration = sum(known_durations)
+    average_duration = total_duration / len(known_durations) if known_durations else 0.0
     
     # Count by category (flatten lists)
     all_categories = []
@@ -273,7 +1582,7 @@ def generate_index_report(all_sparks, output_dir):
 
 - **Total Sparks Analyzed**: {total_sparks}
 - **Total Duration**: {total_duration/60:.1f} minutes
-- **Average Spark Length**: {total_duration/total_sparks:.1f} seconds
+- **Average Spark Length**: {average_duration:.1f} seconds
 
 ### Category Breakdown
 
@@ -378,11 +1687,661 @@ LIMIT 10
     print(f"\n📊 Index report written: {filepath}")
 
 
+# ============================================================================
+# INCREMENTAL MANIFEST
+# ============================================================================
+
+class SparkManifest:
+    """
+    JSON manifest of processed Sparks: path, size, mtime, content hash,
+    pipeline version and output file, plus the duration/category/insight
+    fields generate_index_report needs, so index stats never require
+    re-reading transcripts.
+
+    Saved atomically after every Spark, so a run that crashes midway resumes
+    from the last Spark that was fully written.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.entries = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            self.entries = json.loads(self.path.read_text()).get('sparks', {})
+
+    def is_current(self, spark_file):
+        """
+        True if this Spark was already processed by this pipeline version
+        and its markdown output still exists
+        """
+        entry = self.entries.get(str(spark_file))
+        if not entry or entry['pipeline_version'] != PIPELINE_VERSION:
+            return False
+        if not Path(entry['output_file']).exists():
+            return False
+        
+        stat = spark_file.stat()
+        if stat.st_size == entry['size'] and stat.st_mtime == entry['mtime']:
+            return True
+        
+        # Touched or copied but not changed: hash decides
+        if spark_content_hash(spark_file) == entry['content_hash']:
+            with self._lock:
+                entry['size'] = stat.st_size
+                entry['mtime'] = stat.st_mtime
+            return True
+        return False
+
+    def record(self, spark_data, output_file):
+        """
+        Record a fully written Spark and persist the manifest
+        """
+        spark_file = Path(spark_data['path'])
+        stat = spark_file.stat()
+        entry = {
+            'path': str(spark_file),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'content_hash': spark_content_hash(spark_file),
+            'pipeline_version': PIPELINE_VERSION,
+            'output_file': str(output_file),
+            'processed_at': datetime.now().isoformat(),
+            'duration': spark_data['duration'],
+            'analysis': {
+                'category': spark_data['analysis'].get('category', []),
+                'insight_type': spark_data['analysis'].get('insight_type', 'unknown'),
+            },
+        }
+        with self._lock:
+            self.entries[entry['path']] = entry
+            self.save()
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps({'sparks': self.entries}, indent=1))
+        os.replace(tmp_path, self.path)
+
+    def index_records(self):
+        """
+        Returns: manifest entries whose markdown still exists, in the shape
+        generate_index_report expects (duration + analysis)
+        """
+        return [e for e in self.entries.values() if Path(e['output_file']).exists()]
+
+
+def write_spark(spark_data, output_path, manifest=None, keep_transcript=True):
+    """
+    Write a Spark's markdown and record it in the manifest
+    Returns: spark_data (transcript dropped when keep_transcript is False)
+    """
+    output_file = generate_spark_markdown(spark_data, output_path)
+    if manifest is not None:
+        manifest.record(spark_data, output_file)
+    note_first_result()
+    if not keep_transcript:
+        spark_data.pop('transcript', None)
+        spark_data.pop('segments', None)
+    return spark_data
+
+
+def note_first_result():
+    """
+    Record (once per run) how long after start-up the first Spark was written
+    """
+    with _run_clock_lock:
+        if run_clock['first_result'] is not None:
+            return
+        run_clock['first_result'] = time.perf_counter() - run_clock['started']
+    FIRST_RESULT_SECONDS.observe(run_clock['first_result'])
+    print(f"  ⚡ First Spark written {run_clock['first_result']:.1f}s after start-up")
+
+
+# ============================================================================
+# PARALLEL TRANSCRIPTION
+# ============================================================================
+
+def default_cpu_threads(workers):
+    """
+    Returns: CPU threads per Whisper worker so workers × threads ≈ cores
+    """
+    if WHISPER_CPU_THREADS:
+        return WHISPER_CPU_THREADS
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def load_whisper_model(cpu_threads=0, model_name=WHISPER_MODEL):
+    """
+    Load a Whisper model for CPU inference
+    Returns: WhisperModel
+    """
+    from faster_whisper import WhisperModel
+    return WhisperModel(model_name, device="cpu", compute_type=WHISPER_COMPUTE_TYPE,
+                        cpu_threads=cpu_threads)
+
+
+def profile_models(profile):
+    """
+    Returns: Whisper model names a run with this profile (or "auto") may use
+    """
+    if profile == "auto":
+        names = [name for _, name in AUTO_PROFILE_BY_LENGTH]
+    else:
+        names = [profile]
+    return sorted({TRANSCRIBE_PROFILES[name]['model'] for name in names})
+
+
+class WhisperModels:
+    """
+    Whisper models for one process, each loaded on first use and then kept
+    for the rest of the run (profiles may use different model sizes)
+    """
+
+    def __init__(self, cpu_threads=0):
+        self.cpu_threads = cpu_threads
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            if name not in self._models:
+                with WHISPER_LOAD_SECONDS.time(model=name):
+                    self._models[name] = load_whisper_model(self.cpu_threads, name)
+            return self._models[name]
+
+    def preload(self, names):
+        for name in names:
+            self.get(name)
+
+    def preload_in_background(self, names):
+        """
+        Start loading `names` on a thread; get() waits for a load in progress
+        Returns: the thread
+        """
+        def load():
+            started = time.perf_counter()
+            try:
+                self.preload(names)
+            except Exception as e:
+                # get() will try again (and raise) when a Spark needs the model
+                print(f"  ⚠ Background Whisper load failed: {e}")
+                return
+            print(f"  ✓ Whisper model loaded in the background "
+                  f"({time.perf_counter() - started:.1f}s)")
+
+        thread = threading.Thread(target=load, name="whisper-preload", daemon=True)
+        thread.start()
+        return thread
+
+
+# Per-process state for pool workers (set once by _init_transcribe_worker)
+_worker_models = None
+_worker_cache = None
+
+
+def _init_transcribe_worker(cpu_threads, use_cache, preload=()):
+    global _worker_models, _worker_cache
+    _worker_models = WhisperModels(cpu_threads)
+    _worker_models.preload(preload)
+    _worker_cache = open_transcript_cache() if use_cache else None
+
+
+def _transcribe_in_worker(filepath, profile=None):
+    return transcribe_spark_segments(Path(filepath), _worker_models, _worker_cache, profile)
+
+
+def _worker_ping(delay):
+    time.sleep(delay)
+    return os.getpid()
+
+
+class TranscriptionPool:
+    """
+    Process pool for transcribe_spark. Each worker process loads its own
+    Whisper models once (with cpu_threads threads; `preload` names are loaded
+    at start-up) and opens its own handle on the transcript cache, then
+    transcribes files for the rest of the run.
+    """
+
+    def __init__(self, workers, cpu_threads, use_cache=True, preload=()):
+        self.workers = workers
+        self.cpu_threads = cpu_threads
+        # spawn, not fork: the staged pipeline already has threads running
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_transcribe_worker,
+            initargs=(cpu_threads, use_cache, tuple(preload)),
+        )
+
+    def submit(self, filepath, profile=None):
+        """
+        Returns: Future resolving to (segments, audio duration)
+        """
+        return self._executor.submit(_transcribe_in_worker, str(filepath), profile)
+
+    def transcribe(self, filepath, profile=None):
+        return self.submit(filepath, profile).result()
+
+    def start(self):
+        """
+        Start the workers (and their model loads) now, without waiting
+        Returns: futures that resolve once each worker is up
+        """
+        return [self._executor.submit(_worker_ping, 0.2) for _ in range(self.workers * 2)]
+
+    def warm_up(self):
+        """
+        Block until the workers have started and loaded their models
+        """
+        for future in self.start():
+            future.result()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+# ============================================================================
+# STAGED PIPELINE
+# ============================================================================
+
+# Marks the end of the stream flowing through a stage queue
+_STAGE_DONE = object()
+
+
+class PipelineStage:
+    """
+    One stage of the staged pipeline: worker thread(s) that pull Sparks from
+    an inbox queue, run `func` on each, and push the result to the outbox.
+    `func` returning None drops the Spark (e.g. analysis failed).
+
+    With batch_size > 1, `func` takes a list of up to batch_size Sparks
+    (whatever arrives within batch_wait seconds) and returns a list of
+    results in the same order.
+
+    Tracks items processed, busy time, per-call latency and queue depth for
+    the end-of-run report.
+    """
+
+    def __init__(self, name, func, inbox, outbox, workers=1, batch_size=1, batch_wait=0.0):
+        self.name = name
+        self.func = func
+        self.inbox = inbox
+        self.outbox = outbox
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.processed = 0
+        self.dropped = 0
+        self.busy_seconds = 0.0
+        self.latencies = []
+        self.max_depth = 0
+        self.depth_samples = []
+        self._lock = threading.Lock()
+        self._live_workers = workers
+        self._threads = []
+
+    def start(self):
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def _next_items(self):
+        """
+        Returns: list of items to process next, or None at end of stream
+        """
+        item = self.inbox.get()
+        if item is _STAGE_DONE:
+            # Put it back so sibling workers on this stage also see it
+            self.inbox.put(_STAGE_DONE)
+            return None
+        
+        items = [item]
+        deadline = time.monotonic() + self.batch_wait
+        while len(items) < self.batch_size:
+            try:
+                item = self.inbox.get(timeout=max(deadline - time.monotonic(), 0.001))
+            except queue.Empty:
+                break
+            if item is _STAGE_DONE:
+                self.inbox.put(_STAGE_DONE)
+                break
+            items.append(item)
+        return items
+
+    def _run(self):
+        while True:
+            depth = self.inbox.qsize()
+            items = self._next_items()
+            if items is None:
+                break
+
+            started = time.perf_counter()
+            try:
+                if self.batch_size > 1:
+                    results = self.func(items)
+                else:
+                    results = [self.func(items[0])]
+            except Exception as e:
+                names = ", ".join(item.get('original_filename', '?') for item in items)
+                print(f"  ❌ [{self.name}] {names}: {e}")
+                results = [None] * len(items)
+            elapsed = time.perf_counter() - started
+
+            STAGE_SECONDS.observe(elapsed, stage=self.name)
+            with self._lock:
+                self.busy_seconds += elapsed
+                self.latencies.append(elapsed)
+                self.depth_samples.append(depth)
+                self.max_depth = max(self.max_depth, depth)
+                for result in results:
+                    if result is None:
+                        self.dropped += 1
+                    else:
+                        self.processed += 1
+
+            for result in results:
+                if result is not None:
+                    self.outbox.put(result)
+
+        # Last worker out signals the next stage
+        with self._lock:
+            self._live_workers -= 1
+            last_worker = self._live_workers == 0
+        if last_worker:
+            self.outbox.put(_STAGE_DONE)
+
+
+def probe_spark(spark_file, durations=None):
+    """
+    Extract timestamp and duration metadata for a Spark file
+    durations: results of scan_spark_metadata (None to probe this file now)
+    Returns: partial spark_data dict (no transcript or analysis yet);
+    duration is None if unknown, to be filled in from transcription
+    """
+    timestamp = parse_spark_filename(spark_file.name)
+    if not timestamp:
+        print(f"  ⚠ Could not parse timestamp from {spark_file.name}, using file mtime")
+        timestamp = datetime.fromtimestamp(spark_file.stat().st_mtime)
+
+    if durations is None:
+        duration = get_video_duration(spark_file)
+    else:
+        duration = durations.get(str(spark_file))
+
+    return {
+        'timestamp': timestamp,
+        'duration': duration,
+        'spark_id': spark_file.stem.lower().replace(' ', '-'),
+        'original_filename': spark_file.name,
+        'path': spark_file,
+    }
+
+
+def apply_transcription(spark_data, transcription):
+    """
+    Store a transcriber result (segments, audio duration) on spark_data,
+    taking the duration from Whisper when probing didn't find one
+    """
+    spark_data['segments'], audio_duration = transcription
+    spark_data['transcript'] = join_segments(spark_data['segments'])
+    if spark_data['duration'] is None and audio_duration:
+        spark_data['duration'] = audio_duration
+
+
+def transcribe_with_early_analysis(spark_data, transcriber, early_analysis):
+    """
+    Run the transcriber for one Spark and store its result; with
+    early_analysis the transcriber is handed an EarlyMapAnalysis to feed
+    (kept on spark_data['early'] for analyze_spark)
+    """
+    if early_analysis:
+        spark_data['early'] = EarlyMapAnalysis(debug=DEBUG_MODE)
+        transcription = transcriber(spark_data['path'], on_segment=spark_data['early'].add)
+    else:
+        transcription = transcriber(spark_data['path'])
+    apply_transcription(spark_data, transcription)
+
+
+def run_staged_pipeline(spark_files, transcriber, output_path, manifest=None,
+                        keep_transcripts=True, transcribe_workers=1, analysis_batch_size=1,
+                        durations=None, early_analysis=False, stages_out=None):
+    """
+    Run probe → transcribe → analyze → write as concurrent stages joined by
+    bounded queues, so transcription of Spark N+1 overlaps analysis of Spark N.
+    `transcriber(path)` returns (segments, audio duration); with transcribe_workers > 1
+    it must be safe to call from that many threads (e.g. TranscriptionPool),
+    and transcripts flow on in completion order. With analysis_batch_size > 1
+    transcripts are grouped into batch requests to the gateway. With
+    early_analysis, `transcriber(path, on_segment=...)` streams segments so
+    long Sparks start their map step during transcription. Pass a list as
+    stages_out to get the finished PipelineStage objects (for benchmarks).
+    Returns: list of spark_data dicts that made it through every stage
+    """
+    def transcribe(spark):
+        print(f"[transcribe] {spark['original_filename']}")
+        transcribe_with_early_analysis(spark, transcriber, early_analysis)
+        return spark
+
+    def analyze(spark):
+        print(f"[analyze] {spark['original_filename']}")
+        spark['analysis'] = analyze_spark(spark['segments'], debug=DEBUG_MODE,
+                                          early=spark.pop('early', None))
+        if not spark['analysis']:
+            print(f"  ⚠ Skipping {spark['original_filename']} due to analysis failure")
+            return None
+        return spark
+
+    def analyze_batch(sparks):
+        # Long Sparks go through map-reduce on their own; the rest share a request
+        short = {str(i): spark['transcript'] for i, spark in enumerate(sparks)
+                 if estimate_tokens(spark['transcript']) <= SINGLE_SHOT_MAX_TOKENS}
+        print(f"[analyze] batch of {len(short)}"
+              + (f" + {len(sparks) - len(short)} long" if len(short) < len(sparks) else ""))
+        analyses = analyze_batch_with_mistral(short, debug=DEBUG_MODE) if short else {}
+        results = []
+        for i, spark in enumerate(sparks):
+            early = spark.pop('early', None)
+            if str(i) not in short:
+                analyses[str(i)] = analyze_spark(spark['segments'], debug=DEBUG_MODE, early=early)
+            elif early is not None:
+                early.close()
+            spark['analysis'] = analyses.get(str(i))
+            if not spark['analysis']:
+                print(f"  ⚠ Skipping {spark['original_filename']} due to analysis failure")
+            results.append(spark if spark['analysis'] else None)
+        return results
+
+    def write(spark):
+        result = write_spark(spark, output_path, manifest, keep_transcripts)
+        SPARKS_TOTAL.inc(outcome="written")
+        return result
+
+    # files → probe → transcribe → analyze → write → results
+    files_q = queue.Queue()
+    # Keep enough probed Sparks queued that every transcription worker stays busy
+    probed_q = queue.Queue(maxsize=max(STAGE_QUEUE_SIZE, transcribe_workers))
+    transcribed_q = queue.Queue(maxsize=max(STAGE_QUEUE_SIZE, analysis_batch_size))
+    analyzed_q = queue.Queue(maxsize=STAGE_QUEUE_SIZE)
+    results_q = queue.Queue()
+
+    stages = [
+        PipelineStage("probe", lambda spark_file: probe_spark(spark_file, durations),
+                      files_q, probed_q),
+        PipelineStage("transcribe", transcribe, probed_q, transcribed_q,
+                      workers=transcribe_workers),
+        PipelineStage("analyze", analyze, transcribed_q, analyzed_q,
+                      workers=ANALYSIS_IN_FLIGHT)
+        if analysis_batch_size <= 1 else
+        PipelineStage("analyze", analyze_batch, transcribed_q, analyzed_q,
+                      batch_size=analysis_batch_size, batch_wait=BATCH_WAIT_SECONDS),
+        PipelineStage("write", write, analyzed_q, results_q),
+    ]
+
+    started = time.perf_counter()
+    for stage in stages:
+        stage.start()
+    for spark_file in spark_files:
+        files_q.put(spark_file)
+    files_q.put(_STAGE_DONE)
+
+    all_sparks = []
+    while True:
+        spark = results_q.get()
+        if spark is _STAGE_DONE:
+            break
+        all_sparks.append(spark)
+
+    for stage in stages:
+        stage.join()
+        if stage.dropped:
+            SPARKS_TOTAL.inc(stage.dropped, outcome=f"{stage.name}_failed")
+
+    print_stage_report(stages, time.perf_counter() - started)
+    if stages_out is not None:
+        stages_out.extend(stages)
+    return all_sparks
+
+
+def print_stage_report(stages, wall_seconds):
+    """
+    Print per-stage throughput and queue depth after a staged run
+    """
+    print()
+    print("=" * 70)
+    print("Stage report")
+    print("-" * 70)
+    print(f"{'stage':<12}{'done':>6}{'dropped':>9}{'busy s':>10}{'s/item':>9}"
+          f"{'items/min':>11}{'avg q':>7}{'max q':>7}")
+    for stage in stages:
+        handled = stage.processed + stage.dropped
+        per_item = stage.busy_seconds / handled if handled else 0.0
+        per_min = stage.processed / wall_seconds * 60 if wall_seconds else 0.0
+        avg_depth = (sum(stage.depth_samples) / len(stage.depth_samples)
+                     if stage.depth_samples else 0.0)
+        print(f"{stage.name:<12}{stage.processed:>6}{stage.dropped:>9}"
+              f"{stage.busy_seconds:>10.1f}{per_item:>9.1f}{per_min:>11.1f}"
+              f"{avg_depth:>7.1f}{stage.max_depth:>7}")
+
+    serial_seconds = sum(stage.busy_seconds for stage in stages)
+    print("-" * 70)
+    print(f"Wall clock: {wall_seconds:.1f}s (serial equivalent {serial_seconds:.1f}s, "
+          f"{serial_seconds / wall_seconds if wall_seconds else 0:.2f}x overlap)")
+
+
 # ============================================================================
 # MAIN PIPELINE
 # ============================================================================
 
+def run_serial_pipeline(spark_files, transcriber, output_path, manifest=None,
+                        keep_transcripts=True, durations=None, early_analysis=False):
+    """
+    Process each Spark end-to-end, one at a time (with early_analysis a long
+    Spark's analysis starts while it is still being transcribed)
+    Returns: list of successfully processed spark_data dicts
+    """
+    all_sparks = []
+    
+    for i, spark_file in enumerate(spark_files, 1):
+        print(f"[{i}/{len(spark_files)}] Processing: {spark_file.name}")
+        print("-" * 70)
+        
+        # Extract metadata
+        with STAGE_SECONDS.time(stage="probe"):
+            spark_data = probe_spark(spark_file, durations)
+        
+        print(f"  📅 Timestamp: {spark_data['timestamp'].strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"  ⏱️  Duration: {format_duration(spark_data['duration'])}")
+        
+        # Transcribe
+        with STAGE_SECONDS.time(stage="transcribe"):
+            transcribe_with_early_analysis(spark_data, transcriber, early_analysis)
+        
+        # Analyze with LLM (map-reduce for long Sparks)
+        with STAGE_SECONDS.time(stage="analyze"):
+            spark_data['analysis'] = analyze_spark(spark_data['segments'], debug=DEBUG_MODE,
+                                                   early=spark_data.pop('early', None))
+        
+        if not spark_data['analysis']:
+            print(f"  ⚠ Skipping this Spark due to analysis failure")
+            print()
+            SPARKS_TOTAL.inc(outcome="analyze_failed")
+            continue
+        
+        # Generate individual markdown file
+        with STAGE_SECONDS.time(stage="write"):
+            write_spark(spark_data, output_path, manifest, keep_transcripts)
+        SPARKS_TOTAL.inc(outcome="written")
+        
+        # Add to collection
+        all_sparks.append(spark_data)
+        
+        print()
+    
+    return all_sparks
+
+
+def write_run_metrics(path, mode, started, attempted, processed):
+    """
+    Write this run's metrics as JSON (plus Prometheus text next to it)
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    catalyst_metrics.registry.write(
+        path, prom_path=os.path.splitext(path)[0] + ".prom",
+        extra={
+            'started': datetime.fromtimestamp(started).isoformat(timespec='seconds'),
+            'wall_seconds': round(time.time() - started, 3),
+            'mode': mode,
+            'sparks_attempted': attempted,
+            'sparks_processed': processed,
+            'analysis': dict(analysis_stats),
+        },
+    )
+    print(f"📈 Run metrics: {path}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="The Catalyst - Demo Pipeline")
+    parser.add_argument("--mode", choices=["serial", "staged"], default=PIPELINE_MODE,
+                        help="serial: one Spark at a time; staged: overlap stages across Sparks")
+    parser.add_argument("--max-sparks", type=int, default=MAX_SPARKS,
+                        help="How many Sparks to process")
+    parser.add_argument("--workers", type=int, default=TRANSCRIBE_WORKERS,
+                        help="Transcription worker processes (>1 implies --mode staged)")
+    parser.add_argument("--cpu-threads", type=int, default=None,
+                        help="CPU threads per transcription worker "
+                             "(default: cores / workers)")
+    parser.add_argument("--profile", choices=sorted(TRANSCRIBE_PROFILES) + ["auto"],
+                        default=TRANSCRIBE_PROFILE,
+                        help="Transcription speed/accuracy profile "
+                             "(auto: pick per Spark by length)")
+    parser.add_argument("--batch-size", type=int, default=ANALYSIS_BATCH_SIZE,
+                        help="Sparks per batch analysis request (>1 implies --mode staged)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only process new or changed Sparks (uses the manifest)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Ignore the transcript cache for this run")
+    parser.add_argument("--cache-stats", action="store_true",
+                        help="Print transcript cache statistics and exit")
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
+
+    if args.cache_stats:
+        cache = open_transcript_cache()
+        if cache is None:
+            print("Transcript cache is disabled (TRANSCRIPT_CACHE_PATH is None)")
+        else:
+            print_cache_stats(cache)
+        return
+
     print("=" * 70)
     print("THE CATALYST - Demo Pipeline")
     print("=" * 70)
@@ -401,78 +2360,139 @@ def main():
     print(f"📁 Output: {OUTPUT_DIR}")
     print()
     
+    transcript_cache = None if args.no_cache else open_transcript_cache()
+    
+    # Start Whisper now: the model loads (in workers, or on a thread here)
+    # while Sparks are listed and probed below
+    workers = max(1, args.workers)
+    cpu_threads = args.cpu_threads or default_cpu_threads(workers)
+    pool = whisper_models = None
+    if workers > 1:
+        print(f"🔧 Starting {workers} transcription workers ({cpu_threads} threads each)...")
+        pool = TranscriptionPool(workers, cpu_threads, use_cache=transcript_cache is not None,
+                                 preload=profile_models(args.profile))
+        pool.start()
+    else:
+        # Models load once, then get reused
+        print("🔧 Loading Whisper model in the background...")
+        whisper_models = WhisperModels(args.cpu_threads or WHISPER_CPU_THREADS)
+        whisper_models.preload_in_background(profile_models(args.profile))
+    print()
+    
     # Find Spark files (video/audio)
     video_extensions = {'.mp4', '.mov', '.avi', '.mkv', '.webm', '.m4a', '.mp3', '.wav'}
-    spark_files = [f for f in input_path.iterdir() 
-                   if f.suffix.lower() in video_extensions]
+    spark_files = sorted(f for f in input_path.iterdir() 
+                         if f.suffix.lower() in video_extensions)
+    
+    manifest = SparkManifest(MANIFEST_PATH) if MANIFEST_PATH else None
+    if args.incremental:
+        if manifest is None:
+            print("❌ ERROR: --incremental needs MANIFEST_PATH to be set")
+            if pool:
+                pool.shutdown()
+            return
+        pending = [f for f in spark_files if not manifest.is_current(f)]
+        print(f"♻️  Incremental: {len(spark_files) - len(pending)} up to date, "
+              f"{len(pending)} new or changed")
+        spark_files = pending
     
     # Limit for testing
-    spark_files = spark_files[:MAX_SPARKS]
+    spark_files = spark_files[:args.max_sparks]
     
     print(f"🎯 Found {len(spark_files)} Spark files to process")
     print()
     
-    # Initialize Whisper model (this loads once, then reuses)
-    print("🔧 Loading Whisper model...")
-    whisper_model = WhisperModel(WHISPER_MODEL, device="cpu", compute_type="int8")
-    print("✓ Whisper model loaded")
-    print()
+    # Durations for every Spark in one cached, parallel pass (or from Whisper later)
+    if DURATION_SOURCE == "probe":
+        started = time.perf_counter()
+        durations = scan_spark_metadata(spark_files)
+        unknown = sum(1 for d in durations.values() if d is None)
+        print(f"⏱️  Probed {len(durations)} durations in {time.perf_counter() - started:.1f}s"
+              + (f" ({unknown} unknown, will use Whisper's)" if unknown else ""))
+        print()
+    else:
+        durations = {}
     
-    # Process each Spark
-    all_sparks = []
+    if transcript_cache:
+        print(f"🗄️  Transcript cache: {transcript_cache.path}")
+        cache_before = transcript_cache.stats()
     
-    for i, spark_file in enumerate(spark_files, 1):
-        print(f"[{i}/{len(spark_files)}] Processing: {spark_file.name}")
-        print("-" * 70)
-        
-        # Extract metadata
-        timestamp = parse_spark_filename(spark_file.name)
-        if not timestamp:
-            print(f"  ⚠ Could not parse timestamp from filename, using file mtime")
-            timestamp = datetime.fromtimestamp(spark_file.stat().st_mtime)
-        
-        duration = get_video_duration(spark_file)
-        if not duration:
-            print(f"  ⚠ Could not get duration, estimating 60s")
-            duration = 60.0
-        
-        print(f"  📅 Timestamp: {timestamp.strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"  ⏱️  Duration: {duration:.1f}s")
-        
-        # Transcribe
-        transcript = transcribe_spark(spark_file, whisper_model)
-        
-        # Analyze with LLM
-        analysis = analyze_with_mistral(transcript, debug=DEBUG_MODE)
+    if args.batch_size > 1 and args.mode != "staged":
+        print("ℹ️  --batch-size > 1 runs the staged pipeline")
+        args.mode = "staged"
+    
+    def profile_for(spark_file):
+        return select_profile(args.profile, durations.get(str(spark_file)))
+    
+    if args.profile == "auto" and not durations:
+        print("ℹ️  --profile auto without probed durations uses "
+              f"'{select_profile('auto')}' for every Spark")
+    print(f"🎚️  Transcription profile: {args.profile} "
+          f"(models: {', '.join(profile_models(args.profile))})")
+    
+    # Segments can only be streamed to the analyzer from an in-process model
+    early_analysis = EARLY_ANALYSIS and workers == 1
+    if pool:
+        # Parallel transcription only pays off when the other stages keep flowing
+        if args.mode != "staged":
+            print("ℹ️  --workers > 1 runs the staged pipeline")
+            args.mode = "staged"
+        if workers * cpu_threads > (os.cpu_count() or 1):
+            print(f"  ⚠ {workers} workers × {cpu_threads} threads exceeds "
+                  f"{os.cpu_count()} cores")
         
-        if not analysis:
-            print(f"  ⚠ Skipping this Spark due to analysis failure")
+        def transcriber(spark_file):
+            return pool.transcribe(spark_file, profile_for(spark_file))
+    else:
+        def transcriber(spark_file, on_segment=None):
+            return transcribe_spark_segments(spark_file, whisper_models, transcript_cache,
+                                             profile_for(spark_file), on_segment)
+    print()
+    
+    run_started = time.time()
+    try:
+        if args.mode == "staged":
+            print(f"🏭 Staged pipeline (queue size {STAGE_QUEUE_SIZE})")
             print()
-            continue
-        
-        # Store data
-        spark_data = {
-            'timestamp': timestamp,
-            'duration': duration,
-            'spark_id': spark_file.stem.lower().replace(' ', '-'),
-            'original_filename': spark_file.name,
-            'transcript': transcript,
-            'analysis': analysis
-        }
-        
-        # Generate individual markdown file
-        generate_spark_markdown(spark_data, output_path)
-        
-        # Add to collection
-        all_sparks.append(spark_data)
-        
-        print()
+            all_sparks = run_staged_pipeline(spark_files, transcriber, output_path, manifest,
+                                             keep_transcripts=not args.incremental,
+                                             transcribe_workers=workers,
+                                             analysis_batch_size=args.batch_size,
+                                             durations=durations,
+                                             early_analysis=early_analysis)
+        else:
+            all_sparks = run_serial_pipeline(spark_files, transcriber, output_path, manifest,
+                                             keep_transcripts=not args.incremental,
+                                             durations=durations,
+                                             early_analysis=early_analysis)
+    finally:
+        if pool:
+            pool.shutdown()
+    
+    if RUN_METRICS_PATH:
+        write_run_metrics(RUN_METRICS_PATH, args.mode, run_started, len(spark_files),
+                          len(all_sparks))
+    
+    if analysis_stats['requests']:
+        print(f"🧮 Analysis: {analysis_stats['requests']} requests, "
+              f"{analysis_stats['json_failures']} bad-JSON responses, "
+              f"{analysis_stats['full_retries']} full retries, "
+              f"{analysis_stats['field_repairs']} gateway field repairs")
+    
+    if transcript_cache:
+        # Lifetime counter deltas, so hits inside pool workers are counted too
+        cache_after = transcript_cache.stats()
+        print(f"🗄️  Transcript cache: {cache_after['hits'] - cache_before['hits']} hits, "
+              f"{cache_after['misses'] - cache_before['misses']} misses this run")
+    
+    # Incremental runs report on everything in the manifest, not just this batch
+    index_sparks = manifest.index_records() if args.incremental else all_sparks
     
     # Generate index report
-    if all_sparks:
+    if index_sparks:
         print("=" * 70)
         print("Generating index report...")
-        generate_index_report(all_sparks, output_path)
+        generate_index_report(index_sparks, output_path)
         print()
         print("=" * 70)
         print(f"✨ COMPLETE! Processed {len(all_sparks)} Sparks")
@@ -0,0 +1,319 @@
+"""
+catalyst_metrics.py - Shared instrumentation for the Catalyst pipeline and gateway
+
+Counters, gauges and histograms kept in process memory, rendered in
+Prometheus' text exposition format (for a /metrics endpoint or a
+node_exporter textfile) or as a JSON snapshot (for run summaries). Standard
+library only, so it can sit next to ollama_api.py on wcn-oglaptop as well as
+next to the pipeline.
+"""
+
+import json
+import time
+import bisect
+import threading
+import contextlib
+
+# Latency buckets in seconds: requests and Ollama jobs run from milliseconds
+# (cache hits) to minutes (long generations, Whisper on long Sparks)
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# Token-count buckets for prompt / generated tokens
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+
+def _series_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonic count per label set, e.g. requests by endpoint and status
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _series_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(_series_key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            return [f"{self.name}{_format_labels(key)} {_format_number(value)}"
+                    for key, value in sorted(self._values.items())]
+
+    def snapshot(self):
+        with self._lock:
+            return [{'labels': dict(key), 'value': value}
+                    for key, value in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    """
+    Current value per label set, e.g. requests in flight on each backend
+    """
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = _series_key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def clear(self):
+        """
+        Drop every series (before setting the ones that still exist)
+        """
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    """
+    Bucketed distribution per label set (count, sum, bucket counts), so
+    averages and rough percentiles cost the same however many samples came in
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _series_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0,
+                }
+            series['counts'][bisect.bisect_left(self.buckets, value)] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """
+        Observe the wall-clock seconds spent inside the with-block
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def summary(self, **labels):
+        """
+        Returns: {'count', 'sum', 'avg', 'p50', 'p95'} for one label set
+        (percentiles are bucket upper bounds), or None if nothing observed
+        """
+        with self._lock:
+            series = self._series.get(_series_key(labels))
+            if series is None or not series['count']:
+                return None
+            return self._summarize(series)
+
+    def _summarize(self, series):
+        def quantile(q):
+            rank = q * series['count']
+            seen = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series['counts']):
+                seen += count
+                if seen >= rank:
+                    return bound
+            return float("inf")
+
+        return {
+            'count': series['count'],
+            'sum': round(series['sum'], 6),
+            'avg': round(series['sum'] / series['count'], 6),
+            'p50': quantile(0.5),
+            'p95': quantile(0.95),
+        }
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series['counts']):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(key, ('le', bound))} "
+                                 f"{cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} "
+                             f"{series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series['sum']!r}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+    def snapshot(self):
+        with self._lock:
+            return [dict(labels=dict(key), **self._summarize(series))
+                    for key, series in sorted(self._series.items()) if series['count']]
+
+
+class RollingCounter:
+    """
+    Event counts, failures and latency over a sliding time window, kept in a
+    ring of fixed-width buckets with running totals. Recording and reading
+    are O(1) however many events arrive (expired buckets are subtracted as
+    the clock passes them), and nothing is capped at the last N events.
+    """
+
+    def __init__(self, window_seconds=3600, bucket_seconds=60, clock=time.time):
+        self.bucket_seconds = bucket_seconds
+        self.size = max(1, int(window_seconds // bucket_seconds))
+        self._clock = clock
+        # Per bucket: [bucket number, events, failures, latency sum, latency samples]
+        self._buckets = [[None, 0, 0, 0.0, 0] for _ in range(self.size)]
+        self._totals = [0, 0, 0.0, 0]
+        self._current = None
+        self.last_event = None
+        self._lock = threading.Lock()
+
+    def _advance(self, now):
+        bucket = int(now // self.bucket_seconds)
+        if self._current is not None and bucket <= self._current:
+            return bucket
+        # Expire every bucket the clock moved past (at most the whole ring)
+        first = bucket - self.size + 1 if self._current is None \
+            else max(self._current + 1, bucket - self.size + 1)
+        for number in range(first, bucket + 1):
+            slot = self._buckets[number % self.size]
+            if slot[0] is not None:
+                for i in range(4):
+                    self._totals[i] -= slot[i + 1]
+            slot[:] = [number, 0, 0, 0.0, 0]
+        self._current = bucket
+        return bucket
+
+    def record(self, success=True, latency=None):
+        self._add(None, (1, 0 if success else 1,
+                         latency or 0.0, 0 if latency is None else 1))
+
+    def restore(self, at, count, failures=0, latency_sum=0.0, latency_samples=0):
+        """
+        Add events that already happened at time `at`, pre-aggregated (e.g.
+        reloaded from a job store after a restart); ignored outside the window
+        """
+        self._add(at, (count, failures, latency_sum, latency_samples))
+
+    def _add(self, at, deltas):
+        now = self._clock()
+        at = now if at is None else min(at, now)
+        with self._lock:
+            self._advance(now)
+            bucket = int(at // self.bucket_seconds)
+            if bucket <= self._current - self.size:
+                return
+            slot = self._buckets[bucket % self.size]
+            for i, delta in enumerate(deltas):
+                slot[i + 1] += delta
+                self._totals[i] += delta
+            if self.last_event is None or at > self.last_event:
+                self.last_event = at
+
+    def totals(self):
+        """
+        Returns: {'count', 'failures', 'success_rate', 'avg_latency'} over the window
+        """
+        with self._lock:
+            self._advance(self._clock())
+            count, failures, latency_sum, latency_samples = self._totals
+        return {
+            'count': count,
+            'failures': failures,
+            'success_rate': round((count - failures) / count, 4) if count else None,
+            'avg_latency': latency_sum / latency_samples if latency_samples else None,
+        }
+
+
+class MetricsRegistry:
+    """
+    Named metrics for one process; creating a metric twice returns the first one
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args)
+            return metric
+
+    def counter(self, name, help_text):
+        return self._get_or_create(Counter, name, help_text)
+
+    def gauge(self, name, help_text):
+        return self._get_or_create(Gauge, name, help_text)
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, buckets)
+
+    def render(self):
+        """
+        Returns: every metric in Prometheus text exposition format
+        """
+        lines = []
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """
+        Returns: JSON-ready dict of metric name → list of series
+        """
+        with self._lock:
+            metrics = dict(self._metrics)
+        return {name: metric.snapshot() for name, metric in sorted(metrics.items())}
+
+    def write(self, json_path, prom_path=None, extra=None):
+        """
+        Write a JSON snapshot (merged with `extra`) and optionally the
+        Prometheus text rendering, e.g. at the end of a pipeline run
+        """
+        summary = dict(extra or {})
+        summary['metrics'] = self.snapshot()
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, default=str)
+        if prom_path:
+            with open(prom_path, "w", encoding="utf-8") as f:
+                f.write(self.render())
+
+
+# Process-wide registry shared by everything that imports this module
+registry = MetricsRegistry()
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Mock Ollama - a local stand-in for Ollama's /api/generate, for benchmarks
+
+Answers every prompt with a plausible Evolutions analysis (or a merged
+summary for map-reduce reduce prompts), at a configurable time-to-first-token
+and token rate, and returns broken JSON for a configurable fraction of
+requests so retry and repair paths get exercised. Standard library only.
+
+Prompt evaluation is modelled like Ollama's: the system prompt and prompt
+are read at --prompt-tokens-per-second, except for the leading tokens shared
+with the previous request, which are reused from the (single) KV cache.
+prompt_eval_count / prompt_eval_duration report what was actually evaluated.
+
+Model loading is modelled too: a model that isn't resident takes
+--load-seconds before its first token (reported as load_duration) and stays
+resident for the request's keep_alive (Ollama's default: 5m). An empty
+prompt only loads the model, as with Ollama, and /api/ps lists the
+resident ones. Start several on different ports to stand in for a pool of
+Ollama hosts (OLLAMA_BACKENDS).
+
+Usage: python mock_ollama.py --port 11500 --latency 0.5 --tokens-per-second 40 --malformed-rate 0.05
+       OLLAMA_URL=http://127.0.0.1:11500 uvicorn ollama_api_updated:app --port 8000
+"""
+
+import json
+import time
+import random
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CATEGORIES = ["methodology", "product-strategy", "fitness", "mental-health", "technical", "business"]
+PHASES = ["awareness", "exploration", "integration", "embodiment"]
+INSIGHT_TYPES = ["connection", "obstacle", "decision", "question", "breakthrough", "reflection"]
+ENERGY = ["high", "medium", "low", "frustrated", "excited", "contemplative"]
+CONCEPTS = ["focus", "boundaries", "momentum", "clarity", "feedback", "systems", "rest"]
+
+# Ollama's keep_alive when a request doesn't set one
+DEFAULT_KEEP_ALIVE = "5m"
+
+
+def parse_keep_alive(value):
+    """
+    Returns: seconds a model stays loaded for an Ollama keep_alive value
+    ("30m", "1h", "90s", a number of seconds), or None for "forever" (negative)
+    """
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        units = {"s": 1, "m": 60, "h": 3600}
+        value = str(value).strip()
+        seconds = float(value[:-1]) * units[value[-1]] if value[-1:] in units else float(value)
+    return None if seconds < 0 else seconds
+
+
+class MockSettings:
+    """
+    Behaviour knobs shared by every request handler
+    """
+
+    def __init__(self, latency=0.5, tokens_per_second=40.0, malformed_rate=0.0, seed=None,
+                 prompt_tokens_per_second=400.0, load_seconds=0.0):
+        self.latency = latency
+        self.load_seconds = load_seconds
+        self.tokens_per_second = tokens_per_second
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.malformed_rate = malformed_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.malformed = 0
+        self.prompt_tokens = 0
+        self.prompt_tokens_reused = 0
+        self._cached_prompt = []  # tokens of the last prompt, as the KV cache holds them
+        self._resident = {}       # model -> (loaded at, unloaded at or None)
+        self.loads = 0
+
+    def draw(self):
+        """
+        Returns: (rng seed for this response, whether to make it malformed)
+        """
+        with self.lock:
+            self.requests += 1
+            broken = self.random.random() < self.malformed_rate
+            if broken:
+                self.malformed += 1
+            return self.random.random(), broken
+
+    def load_model(self, model, keep_alive):
+        """
+        Returns: seconds this request waits for `model` to load (0 if resident)
+        """
+        with self.lock:
+            now = time.monotonic()
+            loaded_at, unload_at = self._resident.get(model, (None, None))
+            if loaded_at is None or (unload_at is not None and now > unload_at):
+                loaded_at = now + self.load_seconds
+                self.loads += 1
+            keep = parse_keep_alive(keep_alive)
+            self._resident[model] = (loaded_at, None if keep is None else max(now, loaded_at) + keep)
+            return max(0.0, loaded_at - now)
+
+    def resident_models(self):
+        """
+        Returns: models loaded (or loading) whose keep_alive hasn't expired
+        """
+        with self.lock:
+            now = time.monotonic()
+            return [model for model, (_, unload_at) in self._resident.items()
+                    if unload_at is None or now <= unload_at]
+
+    def evaluate_prompt(self, tokens):
+        """
+        Returns: how many of `tokens` need evaluating, after reusing the
+        prefix shared with the previous prompt
+        """
+        with self.lock:
+            reused = 0
+            for cached, token in zip(self._cached_prompt, tokens):
+                if cached != token:
+                    break
+                reused += 1
+            self._cached_prompt = tokens
+            self.prompt_tokens += len(tokens)
+            self.prompt_tokens_reused += reused
+            return len(tokens) - reused
+
+
+def fake_value(schema, rng):
+    """
+    Returns: a value that satisfies a (simple) JSON schema, as Ollama's
+    constrained decoding would produce
+    """
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: fake_value(sub, rng) for name, sub in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [fake_value(schema.get("items", {}), rng) for _ in range(rng.randint(1, 3))]
+    if kind == "boolean":
+        return rng.random() < 0.5
+    if kind in ("integer", "number"):
+        return rng.randint(0, 10)
+    return " ".join(rng.sample(CONCEPTS, 3))
+
+
+def fake_answer(prompt, rng, fmt=None):
+    """
+    Returns: JSON text shaped like what the Catalyst prompts ask for
+    (or like `fmt` when the request carries a JSON schema)
+    """
+    if isinstance(fmt, dict):
+        answer = fake_value(fmt, rng)
+    elif "PART SUMMARIES" in prompt:
+        answer = {
+            "summary": "Several parts circle the same insight about " + rng.choice(CONCEPTS),
+            "methodology_alignment": "Moves from " + " to ".join(rng.sample(PHASES, 2)),
+        }
+    else:
+        answer = {
+            "category": rng.sample(CATEGORIES, rng.randint(1, 2)),
+            "evolution_phase": rng.choice(PHASES),
+            "insight_type": rng.choice(INSIGHT_TYPES),
+            "energy": rng.choice(ENERGY),
+            "actionable": rng.random() < 0.5,
+            "summary": f"Noticing how {rng.choice(CONCEPTS)} shapes the week ahead",
+            "key_concepts": rng.sample(CONCEPTS, 3),
+            "methodology_alignment": f"An example of the {rng.choice(PHASES)} phase",
+        }
+    return json.dumps(answer, indent=2)
+
+
+def malform(text, rng):
+    """
+    Returns: text that no longer parses as one JSON object
+    """
+    if rng.random() < 0.5:
+        return text[:len(text) // 2]                     # truncated generation
+    return "Sure! Here is the analysis:\n" + text.replace('"', "'")   # chatty, wrong quotes
+
+
+def render_prompt(request):
+    """
+    Returns: the prompt as the model sees it (Mistral's template: system text first)
+    """
+    system = request.get("system")
+    prompt = request.get("prompt", "")
+    return f"[INST] {system}\n\n{prompt} [/INST]" if system else f"[INST] {prompt} [/INST]"
+
+
+def tokenize(text):
+    """
+    Returns: text split into token-sized pieces that join back to the original
+    """
+    pieces = []
+    for i, word in enumerate(text.split(" ")):
+        pieces.append(word if i == 0 else " " + word)
+    return pieces
+
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    settings = MockSettings()
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output readable
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": "mistral:latest"}]})
+        elif self.path == "/api/ps":
+            self._send_json(200, {"models": [
+                {"name": model if ":" in model else f"{model}:latest"}
+                for model in self.settings.resident_models()
+            ]})
+        elif self.path == "/stats":
+            self._send_json(200, {"requests": self.settings.requests,
+                                  "malformed": self.settings.malformed,
+                                  "loads": self.settings.loads,
+                                  "prompt_tokens": self.settings.prompt_tokens,
+                                  "prompt_tokens_reused": self.settings.prompt_tokens_reused})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "invalid JSON body"})
+            return
+
+        model = request.get("model", "mistral")
+        started = time.perf_counter()
+        load_seconds = self.settings.load_model(model, request.get("keep_alive", DEFAULT_KEEP_ALIVE))
+        time.sleep(load_seconds)
+        if not request.get("prompt") and not request.get("system"):
+            # Load-only request
+            self._send_json(200, {"model": model, "response": "", "done": True,
+                                  "done_reason": "load",
+                                  "load_duration": int(load_seconds * 1e9)})
+            return
+
+        seed, broken = self.settings.draw()
+        rng = random.Random(seed)
+        text = fake_answer(request.get("prompt", ""), rng, request.get("format"))
+        if broken:
+            text = malform(text, rng)
+        tokens = tokenize(text)
+
+        prompt_evaluated = self.settings.evaluate_prompt(render_prompt(request).split())
+        prompt_seconds = prompt_evaluated / self.settings.prompt_tokens_per_second
+        time.sleep(self.settings.latency + prompt_seconds)
+        prompt_eval = (prompt_evaluated, prompt_seconds, load_seconds)
+        if request.get("stream", True):
+            self._stream(model, tokens, started, prompt_eval)
+        else:
+            time.sleep(len(tokens) / self.settings.tokens_per_second)
+            self._send_json(200, self._chunk(model, text, True, len(tokens), started, prompt_eval))
+
+    def _chunk(self, model, text, done, eval_count, started, prompt_eval=None):
+        chunk = {
+            "model": model,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "response": text,
+            "done": done,
+        }
+        if done:
+            chunk["eval_count"] = eval_count
+            chunk["prompt_eval_count"] = prompt_eval[0]
+            chunk["prompt_eval_duration"] = int(prompt_eval[1] * 1e9)
+            chunk["load_duration"] = int(prompt_eval[2] * 1e9)
+            chunk["total_duration"] = int((time.perf_counter() - started) * 1e9)
+        return chunk
+
+    def _stream(self, model, tokens, started, prompt_eval):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write_line(body):
+            data = (json.dumps(body) + "\n").encode()
+            self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        try:
+            for token in tokens:
+                time.sleep(1 / self.settings.tokens_per_second)
+                write_line(self._chunk(model, token, False, 0, started))
+            write_line(self._chunk(model, "", True, len(tokens), started, prompt_eval))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client stopped reading early, as Ollama would see it
+
+
+def start_mock_ollama(port=0, latency=0.5, tokens_per_second=40.0, malformed_rate=0.0, seed=None,
+                      prompt_tokens_per_second=400.0, load_seconds=0.0):
+    """
+    Serve the mock on a background thread
+    Returns: (server, base URL); call server.shutdown() when done
+    """
+    handler = type("ConfiguredMockOllamaHandler", (MockOllamaHandler,), {
+        "settings": MockSettings(latency, tokens_per_second, malformed_rate, seed,
+                                 prompt_tokens_per_second, load_seconds),
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-ollama", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for Ollama's /api/generate")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--latency", type=float, default=0.5,
+                        help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=400.0,
+                        help="Prompt evaluation speed for tokens not reused from the KV cache")
+    parser.add_argument("--load-seconds", type=float, default=0.0,
+                        help="Cold model load time (first request, or after keep_alive expires)")
+    parser.add_argument("--malformed-rate", type=float, default=0.0,
+                        help="Fraction of responses that are not valid JSON")
+    parser.add_argument("--seed", type=int, help="Make responses reproducible")
+    args = parser.parse_args()
+
+    server, url = start_mock_ollama(args.port, args.latency, args.tokens_per_second,
+                                    args.malformed_rate, args.seed, args.prompt_tokens_per_second,
+                                    args.load_seconds)
+    print(f"🧪 Mock Ollama on {url} (latency {args.latency}s, "
+          f"{args.tokens_per_second} tok/s, {args.malformed_rate:.0%} malformed)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
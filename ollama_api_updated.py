@@ -4,12 +4,27 @@ ollama_api.py - Updated with public status endpoint for Catalyst demo
 Add this to your existing ollama_api.py on wcn-oglaptop
 """
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-import requests
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+import httpx
+import os
 import json
+import math
+import time
+import heapq
+import sqlite3
+import asyncio
+import uuid
+import hashlib
+import itertools
+import threading
+import contextlib
 from datetime import datetime
-from collections import deque
+from urllib.parse import urlsplit
+from collections import deque, OrderedDict
+
+import catalyst_metrics  # Copy catalyst_metrics.py next to this file on wcn-oglaptop
 
 app = FastAPI()
 
@@ -26,22 +41,1543 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-OLLAMA_ENDPOINT = "http://localhost:11434/api/generate"
+# Override with OLLAMA_URL to point the gateway at another Ollama (or at
+# mock_ollama.py for benchmarks)
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434").rstrip("/")
+
+# Several Ollama hosts to spread generations over (comma-separated base URLs,
+# e.g. "http://localhost:11434,http://gpu2.lan:11434"); defaults to OLLAMA_URL.
+# Each request goes to a host that already has its model loaded if one has a
+# free slot, else to the host with the fewest requests outstanding.
+OLLAMA_BACKENDS = [url.strip().rstrip("/")
+                   for url in os.environ.get("OLLAMA_BACKENDS", OLLAMA_URL).split(",")
+                   if url.strip()]
+
+# Each backend's /api/tags (reachable? which models?) and /api/ps (which are
+# loaded?) are re-read this often; one that doesn't answer within
+# BACKEND_CHECK_TIMEOUT has its circuit opened (see below)
+BACKEND_CHECK_SECONDS = 10
+BACKEND_CHECK_TIMEOUT = 2
+
+# Per-request timeout for a full (non-streamed) generation, until enough
+# generations have been seen to size it adaptively (see below)
+OLLAMA_TIMEOUT = 60
+
+# Adaptive timeout: p95 of recent generation times × margin, plus time to
+# read this prompt at the observed prompt-eval rate, clamped to [MIN, MAX]
+ADAPTIVE_TIMEOUT_SAMPLES = 10   # generations seen before OLLAMA_TIMEOUT is replaced
+ADAPTIVE_TIMEOUT_MARGIN = 2.0
+ADAPTIVE_TIMEOUT_MIN = 15
+ADAPTIVE_TIMEOUT_MAX = 180
+DEFAULT_PROMPT_TOKENS_PER_SECOND = 200  # until Ollama has reported its own
+
+# Circuit breaker, per backend: after BREAKER_FAILURES consecutive failures
+# (connection errors, timeouts, 5xx) the backend gets no requests for
+# BREAKER_COOLDOWN seconds, then one /api/tags probe decides whether it's back.
+# With every backend open, requests get an immediate 503 with Retry-After.
+BREAKER_FAILURES = 5
+BREAKER_COOLDOWN = 30
+
+# Keep-alive connection pool to Ollama, shared by every request (per backend)
+OLLAMA_MAX_CONNECTIONS = 8
+OLLAMA_KEEPALIVE_EXPIRY = 120  # seconds an idle connection stays open
+
+# Created at startup; one pooled async client instead of a new
+# blocking connection per request
+ollama_client = None
+
+# How long Ollama keeps a model loaded after a request (Ollama's default is
+# 5m; an unloaded Mistral costs a multi-second reload on the 6 GB GPU)
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+
+# Models loaded into Ollama as the gateway starts (comma-separated,
+# env-overridable; empty for none), so the first real request doesn't pay a
+# multi-second cold load. /health answers 503 "warming" until they're resident.
+WARMUP_MODELS = [model for model in os.environ.get("WARMUP_MODELS", "mistral").split(",")
+                 if model.strip()]
+WARMUP_TIMEOUT = 300        # seconds a model load may take (first load reads it from disk)
+WARMUP_RETRY_SECONDS = 10   # Ollama not up yet: try again after this long
+
+# Prompt templates: static instructions registered once via /api/templates and
+# sent to Ollama as the system prompt, ahead of each request's own text. The
+# identical prefix lets Ollama reuse its evaluated KV cache between requests
+# instead of re-reading several hundred tokens of instructions every time.
+MAX_PROMPT_TEMPLATES = 32
+
+# Generations allowed to run on each backend at once (the GTX 1060 fits one
+# Mistral job); the scheduler runs this many per backend in total
+OLLAMA_CONCURRENCY = 1
+
+# Requests allowed to wait for a slot before new ones get a 429
+MAX_QUEUE_DEPTH = 20
+
+# Lower runs first: interactive review ahead of batch analysis
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+PRIORITIES = {"interactive": PRIORITY_INTERACTIVE, "batch": PRIORITY_BATCH}
+
+# /api/analyze/batch: max items per request, and how many of one batch's
+# items may sit in the scheduler at once (so a big batch can't fill the queue)
+MAX_BATCH_ITEMS = 200
+BATCH_CONCURRENCY = OLLAMA_CONCURRENCY * len(OLLAMA_BACKENDS)
+# How often a non-streamed batch checks that its client is still connected
+# (a client that gave up would otherwise leave its items queued on the GPU)
+BATCH_DISCONNECT_POLL_SECONDS = 1
+
+# Opt-in LLM response cache: a repeat of the same (model, prompt, options)
+# is answered from memory or SQLite instead of the GPU. Requests can opt
+# in/out individually with "cache": true/false.
+RESPONSE_CACHE_ENABLED = False
+RESPONSE_CACHE_PATH = "ollama_response_cache.sqlite"
+RESPONSE_CACHE_MEMORY_ENTRIES = 256     # hot tier, in-process
+RESPONSE_CACHE_MAX_ENTRIES = 20000      # persistent tier, LRU-evicted beyond this
+RESPONSE_CACHE_TTL = 7 * 24 * 3600      # seconds
+
+# Structured output: when a request carries a JSON schema, generation is
+# constrained to it and only missing/invalid fields are re-asked, at most
+# this many times, instead of regenerating the whole answer
+STRUCTURED_REPAIR_ATTEMPTS = 2
+
+# /status is served from a snapshot rebuilt every STATUS_REFRESH_SECONDS by a
+# background task, so public polling never competes with inference. Tunnel/CDN
+# and browsers may reuse it for STATUS_MAX_AGE seconds (and revalidate by ETag).
+STATUS_REFRESH_SECONDS = 10
+STATUS_MAX_AGE = 15
+
+# Every finished job (model, timings, tokens, status, cache hit) goes to a
+# SQLite file, so status and job counts survive a gateway restart. Writes are
+# buffered and inserted in batches by a background task: every
+# JOB_STORE_FLUSH_SECONDS, or sooner once JOB_STORE_BATCH_SIZE jobs are waiting.
+JOB_STORE_PATH = "gateway_jobs.sqlite"
+JOB_STORE_FLUSH_SECONDS = 2
+JOB_STORE_BATCH_SIZE = 50
+JOB_STORE_RETENTION_DAYS = 90  # older jobs are pruned at startup
+
+# Rolling job counts for the status widget: per-minute buckets over the
+# last hour and day, so /status costs the same however busy the GPU is
+# (reloaded from the job store at startup)
+jobs_last_hour = catalyst_metrics.RollingCounter(3600, 60)
+jobs_last_day = catalyst_metrics.RollingCounter(24 * 3600, 60)
+
+# Instrumentation, exposed on /metrics (Prometheus text format)
+REQUEST_SECONDS = catalyst_metrics.registry.histogram(
+    "gateway_request_seconds",
+    "Seconds until the response starts, by endpoint (whole body unless streamed)")
+REQUESTS_TOTAL = catalyst_metrics.registry.counter(
+    "gateway_requests_total", "Requests by endpoint and HTTP status")
+QUEUE_WAIT_SECONDS = catalyst_metrics.registry.histogram(
+    "gateway_queue_wait_seconds", "Seconds requests waited for an Ollama slot")
+OLLAMA_SECONDS = catalyst_metrics.registry.histogram(
+    "ollama_duration_seconds", "Ollama-reported time per generation, by phase")
+OLLAMA_TOKENS = catalyst_metrics.registry.histogram(
+    "ollama_tokens", "Tokens per Ollama generation, by kind (prompt or eval)",
+    catalyst_metrics.TOKEN_BUCKETS)
+OLLAMA_FAILURES = catalyst_metrics.registry.counter(
+    "ollama_failures_total", "Failed Ollama calls, by backend and reason")
+BREAKER_EVENTS = catalyst_metrics.registry.counter(
+    "ollama_breaker_events_total",
+    "Circuit breaker transitions (opened, closed) by backend, and requests "
+    "rejected with every backend open")
+BACKEND_REQUESTS = catalyst_metrics.registry.counter(
+    "ollama_backend_requests_total",
+    "Generations sent to each backend, by routing (sticky: model already loaded there)")
+BACKEND_OUTSTANDING = catalyst_metrics.registry.gauge(
+    "ollama_backend_outstanding", "Generations in flight on each backend")
+BACKEND_CIRCUIT = catalyst_metrics.registry.gauge(
+    "ollama_backend_circuit", "1 for each backend's current circuit breaker state")
+BACKEND_LOADED = catalyst_metrics.registry.gauge(
+    "ollama_backend_model_loaded", "1 for each model loaded on each backend")
+JOBS_TOTAL = catalyst_metrics.registry.counter(
+    "gateway_jobs_total", "Analysis jobs by status and cache hit, including "
+    "those recorded before the last restart")
+
+
+# ============================================================================
+# JOB STORE
+# ============================================================================
+
+class JobStore:
+    """
+    Append-only record of finished jobs in a SQLite file (WAL mode), indexed
+    by finish time for time-range stats.
+    
+    add() only appends to an in-memory buffer; a background task writes the
+    buffer in one transaction per batch, in a thread, so a request never waits
+    on the disk. Jobs still buffered when the process dies are lost.
+    """
+
+    COLUMNS = ("id", "endpoint", "model", "received", "finished", "latency",
+               "prompt_tokens", "eval_tokens", "status", "cache_hit")
+
+    def __init__(self, path, batch_size):
+        self.batch_size = batch_size
+        self._pending = []
+        self._wake = None  # asyncio.Event, created once the loop is running
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                model TEXT,
+                received REAL NOT NULL,
+                finished REAL NOT NULL,
+                latency REAL NOT NULL,
+                prompt_tokens INTEGER,
+                eval_tokens INTEGER,
+                status TEXT NOT NULL,
+                cache_hit INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_finished ON jobs(finished)")
+        self._conn.commit()
+
+    def add(self, job):
+        """
+        Queue one job dict (keys from COLUMNS) for the next batch write
+        """
+        self._pending.append(tuple(job.get(column) for column in self.COLUMNS))
+        if len(self._pending) >= self.batch_size and self._wake:
+            self._wake.set()
+
+    async def flush(self):
+        batch, self._pending = self._pending, []
+        if batch:
+            await asyncio.to_thread(self._insert, batch)
+
+    async def flush_forever(self, interval):
+        self._wake = asyncio.Event()
+        while True:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wake.wait(), interval)
+            self._wake.clear()
+            try:
+                await self.flush()
+            except sqlite3.Error as e:
+                print(f"⚠ Job store write failed: {e}")
+
+    def _insert(self, batch):
+        placeholders = ", ".join("?" * len(self.COLUMNS))
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO jobs ({', '.join(self.COLUMNS)}) "
+                f"VALUES ({placeholders})", batch
+            )
+            self._conn.commit()
+
+    def prune(self, before):
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM jobs WHERE finished < ?", (before,)).rowcount
+            self._conn.commit()
+        return deleted
+
+    def per_minute(self, since):
+        """
+        Returns: [(minute start, jobs, failures, latency sum)] for GPU jobs
+        (cache hits excluded) finished since `since`
+        """
+        with self._lock:
+            return self._conn.execute("""
+                SELECT CAST(finished / 60 AS INTEGER) * 60, COUNT(*),
+                       SUM(status != 'ok'), SUM(latency)
+                FROM jobs WHERE finished >= ? AND cache_hit = 0
+                GROUP BY 1 ORDER BY 1
+            """, (since,)).fetchall()
+
+    def totals(self):
+        """
+        Returns: [(status, cache_hit, jobs)] over everything stored
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT status, cache_hit, COUNT(*) FROM jobs GROUP BY 1, 2"
+            ).fetchall()
+
+    def last_finished(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT MAX(finished) FROM jobs WHERE cache_hit = 0"
+            ).fetchone()[0]
+
+    def stats(self, since, until):
+        """
+        Returns: per-model job counts, cache hits, latency and tokens for
+        jobs finished in [since, until)
+        """
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT model, COUNT(*), SUM(status != 'ok'), SUM(cache_hit),
+                       AVG(CASE WHEN cache_hit = 0 THEN latency END), MAX(latency),
+                       SUM(prompt_tokens), SUM(eval_tokens)
+                FROM jobs WHERE finished >= ? AND finished < ?
+                GROUP BY model ORDER BY model
+            """, (since, until)).fetchall()
+        return [{
+            "model": model,
+            "jobs": jobs,
+            "failures": failures,
+            "cache_hits": cache_hits,
+            "avg_latency": round(avg_latency, 3) if avg_latency is not None else None,
+            "max_latency": round(max_latency, 3),
+            "prompt_tokens": prompt_tokens or 0,
+            "eval_tokens": eval_tokens or 0,
+        } for model, jobs, failures, cache_hits, avg_latency, max_latency,
+              prompt_tokens, eval_tokens in rows]
+
+
+job_store = JobStore(JOB_STORE_PATH, JOB_STORE_BATCH_SIZE)
+job_store_flusher = None
+
+
+def record_job(started, success=True, endpoint="/api/analyze", model=None,
+               result=None, cache_hit=False):
+    """
+    Record a finished job (started: time.monotonic() when the request came in;
+    result: Ollama's final response, for token counts). Cache hits are stored
+    but don't count towards the GPU job rates on /status.
+    """
+    latency = time.monotonic() - started
+    result = result or {}
+    finished = time.time()
+    job_store.add({
+        "id": uuid.uuid4().hex,
+        "endpoint": endpoint,
+        "model": model,
+        "received": finished - latency,
+        "finished": finished,
+        "latency": latency,
+        "prompt_tokens": result.get("prompt_eval_count"),
+        "eval_tokens": result.get("eval_count"),
+        "status": "ok" if success else "failed",
+        "cache_hit": int(cache_hit),
+    })
+    JOBS_TOTAL.inc(status="ok" if success else "failed", cache="hit" if cache_hit else "miss")
+    if not cache_hit:
+        jobs_last_hour.record(success, latency)
+        jobs_last_day.record(success, latency)
+
+
+def last_processed():
+    """
+    Returns: UTC ISO timestamp of the most recent job, or None
+    """
+    if jobs_last_day.last_event is None:
+        return None
+    return datetime.utcfromtimestamp(jobs_last_day.last_event).isoformat()
+
+
+async def restore_job_history():
+    """
+    Reload the rolling job counts and job totals from the store
+    Returns: number of GPU jobs restored into the last-day window
+    """
+    pruned = await asyncio.to_thread(
+        job_store.prune, time.time() - JOB_STORE_RETENTION_DAYS * 24 * 3600)
+    if pruned:
+        print(f"🧹 Pruned {pruned} jobs older than {JOB_STORE_RETENTION_DAYS} days")
+    
+    restored = 0
+    for minute, jobs, failures, latency_sum in await asyncio.to_thread(
+            job_store.per_minute, time.time() - 24 * 3600):
+        jobs_last_hour.restore(minute, jobs, failures, latency_sum, jobs)
+        jobs_last_day.restore(minute, jobs, failures, latency_sum, jobs)
+        restored += jobs
+    
+    for status, cache_hit, jobs in await asyncio.to_thread(job_store.totals):
+        JOBS_TOTAL.inc(jobs, status=status, cache="hit" if cache_hit else "miss")
+    
+    # Restored buckets only know the minute; the last job may also be older than a day
+    last = await asyncio.to_thread(job_store.last_finished)
+    if last is not None:
+        jobs_last_day.last_event = max(last, jobs_last_day.last_event or 0)
+    return restored
+
+
+@app.on_event("startup")
+async def open_job_store():
+    global job_store_flusher
+    restored = await restore_job_history()
+    if restored:
+        print(f"📒 Restored {restored} jobs from the last day ({JOB_STORE_PATH})")
+    job_store_flusher = asyncio.create_task(job_store.flush_forever(JOB_STORE_FLUSH_SECONDS))
+
+
+@app.on_event("shutdown")
+async def close_job_store():
+    if job_store_flusher:
+        job_store_flusher.cancel()
+    await job_store.flush()
+
+
+# ============================================================================
+# REQUEST SCHEDULER
+# ============================================================================
+
+class QueueFull(Exception):
+    """Raised when the wait queue is at MAX_QUEUE_DEPTH"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"queue full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class OllamaScheduler:
+    """
+    Admission control in front of Ollama. At most `concurrency` generations
+    run at once; the rest wait in priority order (FIFO within a priority),
+    and once `max_queue` are waiting new requests are rejected with QueueFull.
+
+    Usage:
+        async with scheduler.slot(PRIORITY_BATCH):
+            result = await ollama_generate(...)
+    """
+
+    def __init__(self, concurrency, max_queue):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.running = 0
+        self._waiters = []  # heap of [priority, seq, future]
+        self._seq = itertools.count()
+        self.wait_times = deque(maxlen=100)
+        self.service_times = deque(maxlen=100)
+
+    @property
+    def queue_depth(self):
+        return len(self._waiters)
+
+    def estimate_wait(self, position=None):
+        """
+        Returns: estimated seconds until a request at `position` gets a slot
+        """
+        position = self.queue_depth if position is None else position
+        avg_service = (sum(self.service_times) / len(self.service_times)
+                       if self.service_times else OLLAMA_TIMEOUT)
+        return avg_service * (position + 1) / self.concurrency
+
+    def check_admission(self):
+        """
+        Raise QueueFull if a request arriving now would be rejected
+        """
+        must_wait = self.running >= self.concurrency or self._waiters
+        if must_wait and len(self._waiters) >= self.max_queue:
+            raise QueueFull(max(1, math.ceil(self.estimate_wait())))
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority=PRIORITY_BATCH):
+        enqueued = time.monotonic()
+        
+        if self.running < self.concurrency and not self._waiters:
+            self.running += 1
+        else:
+            self.check_admission()
+            entry = [priority, next(self._seq), asyncio.get_running_loop().create_future()]
+            heapq.heappush(self._waiters, entry)
+            try:
+                await entry[2]
+            except asyncio.CancelledError:
+                if entry[2].done() and not entry[2].cancelled():
+                    # Slot was handed over just as the client went away
+                    self._release()
+                else:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                raise
+        
+        self.wait_times.append(time.monotonic() - enqueued)
+        QUEUE_WAIT_SECONDS.observe(self.wait_times[-1])
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.service_times.append(time.monotonic() - started)
+            self._release()
+
+    def resize(self, concurrency):
+        """
+        Change how many generations may run at once (backends came or went)
+        """
+        self.concurrency = concurrency
+        while self.running < self.concurrency and self._wake_next():
+            self.running += 1
+
+    def _wake_next(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return True
+        return False
+
+    def _release(self):
+        # Hand the slot straight to the next waiter; `running` stays the same
+        if self.running > self.concurrency or not self._wake_next():
+            self.running -= 1
+
+
+scheduler = OllamaScheduler(OLLAMA_CONCURRENCY * len(OLLAMA_BACKENDS), MAX_QUEUE_DEPTH)
+
+
+def request_priority(payload, default):
+    """
+    Returns: scheduler priority from payload["priority"] ("interactive"/"batch")
+    """
+    return PRIORITIES.get(payload.get("priority"), default)
+
+
+def queue_full_response(error):
+    """
+    Returns: 429 response telling the client when to retry
+    """
+    return JSONResponse(
+        status_code=429,
+        content={"error": "queue full", "retry_after": error.retry_after},
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
+
+# ============================================================================
+# RESPONSE CACHE
+# ============================================================================
+
+class ResponseCache:
+    """
+    Two-tier cache of Ollama responses: an in-memory LRU for hot entries in
+    front of a SQLite table that survives restarts. Entries expire after
+    `ttl` seconds; the SQLite tier evicts least-recently-used rows once it
+    holds more than `max_entries`.
+    
+    SQLite work runs in a thread so lookups never block the event loop. The
+    file is only opened (and created) on first use, so a gateway that never
+    caches never touches it.
+    """
+
+    def __init__(self, path, memory_entries, max_entries, ttl):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # key -> (created, result)
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        # Called with self._lock held
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def make_key(model, prompt, options=None, fmt=None, system=None):
+        # Whitespace-only differences in the prompt shouldn't miss
+        normalized = " ".join(prompt.split())
+        key = [model, normalized, options or {}, fmt]
+        if system:
+            key.append(" ".join(system.split()))
+        payload = json.dumps(key, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    async def get(self, key):
+        """
+        Returns: (result dict, age in seconds) or None
+        """
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry and now - entry[0] < self.ttl:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return entry[1], now - entry[0]
+        
+        entry = await asyncio.to_thread(self._disk_get, key, now)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.disk_hits += 1
+        self._remember(key, *entry)
+        return entry[1], now - entry[0]
+
+    async def put(self, key, model, result):
+        # Only what the endpoints return; Ollama's context array can be huge
+        result = {"response": result.get("response", "")}
+        created = time.time()
+        self._remember(key, created, result)
+        await asyncio.to_thread(self._disk_put, key, model, result, created)
+
+    def _remember(self, key, created, result):
+        self._memory[key] = (created, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key, now):
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT result, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] >= self.ttl:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            conn.commit()
+        return row[1], json.loads(row[0])
+
+    def _disk_put(self, key, model, result, created):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, result, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model, json.dumps(result), created, created)
+            )
+            conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            conn.commit()
+
+    def stats(self):
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "hits": hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+response_cache = ResponseCache(
+    RESPONSE_CACHE_PATH, RESPONSE_CACHE_MEMORY_ENTRIES,
+    RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL,
+)
+
+
+def cache_requested(payload):
+    """
+    Returns: True if this request should use the response cache
+    """
+    return bool(payload.get("cache", RESPONSE_CACHE_ENABLED))
+
+
+def cacheable(text, fmt=None):
+    """
+    Returns: True if a generation is worth caching: a JSON object, valid
+    against `fmt` when that is a schema. Anything else would be served back
+    unchanged to every retry of the same prompt until it expired.
+    """
+    data = parse_json_object(text)
+    if not data:
+        return False
+    return not isinstance(fmt, dict) or not schema_problems(data, fmt)
+
+
+def set_cache_headers(response, cache_status, age):
+    response.headers["X-Cache"] = cache_status
+    if cache_status == "HIT":
+        response.headers["Age"] = str(int(age))
+
+
+# ============================================================================
+# OLLAMA BACKENDS: CIRCUIT BREAKERS, ADAPTIVE TIMEOUTS, ROUTING
+# ============================================================================
+
+class OllamaUnavailable(Exception):
+    """Raised when an Ollama call failed, or without calling while every breaker is open"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through, consecutive failures are counted.
+    Open (after `failure_threshold` of them): calls fail at once with
+    OllamaUnavailable until `cooldown` seconds have passed.
+    Half-open: the first call after the cooldown runs `probe()`; success
+    closes the breaker, failure opens it for another cooldown. Calls arriving
+    during the probe wait for its verdict.
+    """
+
+    def __init__(self, failure_threshold, cooldown, probe, name="Ollama"):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = None
+        self._probe = probe
+        self._probe_lock = asyncio.Lock()
+
+    def retry_after(self):
+        """
+        Returns: seconds a client should wait before trying again
+        """
+        if self.state == "closed":
+            return 1
+        return max(1, math.ceil(self._opened_at + self.cooldown - time.monotonic()))
+
+    def available(self):
+        """
+        Returns: True if a call now would go through (or get to probe)
+        """
+        return self.state != "open" or time.monotonic() - self._opened_at >= self.cooldown
+
+    async def allow(self):
+        """
+        Raises: OllamaUnavailable while open (or if the half-open probe fails)
+        """
+        if self.state == "closed":
+            return
+        if time.monotonic() - self._opened_at < self.cooldown:
+            raise OllamaUnavailable("Ollama unavailable (circuit open)", self.retry_after())
+        async with self._probe_lock:
+            if self.state == "closed":
+                return  # another request's probe succeeded
+            if time.monotonic() - self._opened_at < self.cooldown:
+                raise OllamaUnavailable("Ollama unavailable (circuit open)", self.retry_after())
+            self.state = "half-open"
+            if await self._probe():
+                self._close()
+            else:
+                self._open()
+                raise OllamaUnavailable("Ollama unavailable (probe failed)", self.retry_after())
+
+    def record_success(self):
+        self.failures = 0
+        if self.state != "closed":
+            self._close()
+
+    def record_failure(self, reason):
+        OLLAMA_FAILURES.inc(backend=self.name, reason=reason)
+        self.failures += 1
+        if self.state == "half-open" or self.failures >= self.failure_threshold:
+            self._open(f"after {self.failures} failures")
+
+    def health_check_passed(self):
+        """
+        Count a passing /api/tags check as the probe: close the breaker once
+        its cooldown is over. Failures counted while closed stand, and an open
+        breaker still sits out its cooldown: /api/tags can answer while
+        generations keep timing out.
+        """
+        if self.state != "closed" and self.available():
+            self._close()
+
+    def trip(self):
+        """
+        Open straight away (a health check found the backend down)
+        """
+        if self.state != "open":
+            self._open("health check failed")
+
+    def _open(self, reason="probe failed"):
+        if self.state != "open":
+            BREAKER_EVENTS.inc(backend=self.name, event="opened")
+            print(f"⚠ {self.name} circuit open ({reason}); no requests for {self.cooldown}s")
+        self.state = "open"
+        self._opened_at = time.monotonic()
+
+    def _close(self):
+        BREAKER_EVENTS.inc(backend=self.name, event="closed")
+        print(f"✓ {self.name} circuit closed")
+        self.state = "closed"
+        self.failures = 0
+
+
+class AdaptiveTimeout:
+    """
+    Timeouts sized from what Ollama has actually been taking, so a hung call
+    is given up on well before 60s when generations normally take a few
+    seconds, while long prompts still get the extra time they need
+    """
+
+    def __init__(self, default, margin, minimum, maximum, min_samples):
+        self.default = default
+        self.margin = margin
+        self.minimum = minimum
+        self.maximum = maximum
+        self.min_samples = min_samples
+        self.durations = deque(maxlen=200)      # seconds per generation
+        self.prompt_rates = deque(maxlen=50)    # prompt tokens evaluated per second
+
+    def observe(self, result):
+        """
+        Learn from Ollama's final response (durations in nanoseconds)
+        """
+        if result.get("total_duration"):
+            self.durations.append(result["total_duration"] / 1e9)
+        if result.get("prompt_eval_count") and result.get("prompt_eval_duration"):
+            self.prompt_rates.append(result["prompt_eval_count"]
+                                     / (result["prompt_eval_duration"] / 1e9))
+
+    def for_prompt(self, prompt, system=None):
+        """
+        Returns: seconds to allow a generation of this prompt
+        """
+        if len(self.durations) < self.min_samples:
+            return self.default
+        ordered = sorted(self.durations)
+        p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+        rates = sorted(self.prompt_rates)
+        rate = rates[len(rates) // 2] if rates else DEFAULT_PROMPT_TOKENS_PER_SECOND
+        prompt_tokens = (len(prompt) + len(system or "")) / 4  # ~4 characters per token
+        timeout = self.margin * p95 + prompt_tokens / rate
+        return round(min(self.maximum, max(self.minimum, timeout)), 1)
+
+
+def model_name(model):
+    """
+    Returns: `model` as Ollama lists it ("mistral" -> "mistral:latest")
+    """
+    return model if ":" in model else f"{model}:latest"
+
+
+class OllamaBackend:
+    """
+    One Ollama host: its circuit breaker and timeouts, the requests
+    outstanding on it, the models it has (/api/tags) and the ones it has
+    loaded (/api/ps, plus whatever it just served)
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.name = urlsplit(url).netloc or url
+        self.generate_endpoint = f"{url}/api/generate"
+        self.tags_endpoint = f"{url}/api/tags"
+        self.ps_endpoint = f"{url}/api/ps"
+        self.outstanding = 0
+        self.models = None  # unknown until the first check: assume any
+        self.loaded = set()
+        self.breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_COOLDOWN, self.check, self.name)
+        self.timeout = AdaptiveTimeout(OLLAMA_TIMEOUT, ADAPTIVE_TIMEOUT_MARGIN,
+                                       ADAPTIVE_TIMEOUT_MIN, ADAPTIVE_TIMEOUT_MAX,
+                                       ADAPTIVE_TIMEOUT_SAMPLES)
+
+    def has_model(self, model):
+        return self.models is None or model_name(model) in self.models
+
+    def has_loaded(self, model):
+        return model_name(model) in self.loaded
+
+    async def check(self):
+        """
+        Refresh the model lists
+        Returns: True if /api/tags answered within BACKEND_CHECK_TIMEOUT
+        """
+        try:
+            tags = await ollama_client.get(self.tags_endpoint, timeout=BACKEND_CHECK_TIMEOUT)
+            if tags.status_code != 200:
+                return False
+            self.models = {model_name(m["name"]) for m in tags.json().get("models", [])}
+        except httpx.HTTPError:
+            return False
+        try:
+            ps = await ollama_client.get(self.ps_endpoint, timeout=BACKEND_CHECK_TIMEOUT)
+            if ps.status_code == 200:
+                self.loaded = {model_name(m["name"]) for m in ps.json().get("models", [])}
+        except httpx.HTTPError:
+            pass  # older Ollama without /api/ps: keep what it has served
+        return True
+
+    def record_gauges(self):
+        BACKEND_OUTSTANDING.set(self.outstanding, backend=self.name)
+        for state in ("closed", "half-open", "open"):
+            BACKEND_CIRCUIT.set(int(self.breaker.state == state), backend=self.name, state=state)
+        for model in self.loaded:
+            BACKEND_LOADED.set(1, backend=self.name, model=model)
+
+
+class BackendPool:
+    """
+    Routes each generation to a backend: one with the model already loaded
+    and a free slot if there is one (sticky: no reload, warm KV cache),
+    otherwise the one with the fewest requests outstanding. Backends whose
+    circuit is open are skipped, as are ones /api/tags says lack the model.
+
+    Usage:
+        async with backend_pool.backend("mistral") as backend:
+            response = await ollama_client.post(backend.generate_endpoint, ...)
+    """
+
+    def __init__(self, urls):
+        self.backends = [OllamaBackend(url) for url in urls]
+
+    def retry_after(self):
+        """
+        Returns: seconds until some backend may take requests again
+        """
+        return min(backend.breaker.retry_after() for backend in self.backends)
+
+    def ensure_available(self):
+        """
+        Raises: OllamaUnavailable if every backend's circuit is open
+        """
+        if not any(backend.breaker.available() for backend in self.backends):
+            BREAKER_EVENTS.inc(event="rejected")
+            raise OllamaUnavailable("Ollama unavailable (circuit open)", self.retry_after())
+
+    def candidates(self, model, exclude=()):
+        """
+        Returns: backends that could run `model` now, best first
+        """
+        usable = [backend for backend in self.backends
+                  if backend.breaker.available() and backend not in exclude]
+        # No backend lists the model: let Ollama answer for itself
+        usable = [backend for backend in usable if backend.has_model(model)] or usable
+        return sorted(usable, key=lambda backend: (
+            not (backend.has_loaded(model) and backend.outstanding < OLLAMA_CONCURRENCY),
+            backend.outstanding,
+        ))
+
+    @contextlib.asynccontextmanager
+    async def backend(self, model, exclude=()):
+        """
+        Pick a backend for `model`, counted as outstanding while the block runs
+        Raises: OllamaUnavailable if none is available
+        """
+        for backend in self.candidates(model, exclude):
+            try:
+                await backend.breaker.allow()
+                break
+            except OllamaUnavailable:
+                continue  # its half-open probe failed
+        else:
+            raise OllamaUnavailable("no Ollama backend available", self.retry_after())
+        
+        routing = "sticky" if backend.has_loaded(model) else "least_outstanding"
+        BACKEND_REQUESTS.inc(backend=backend.name, routing=routing)
+        backend.outstanding += 1
+        try:
+            yield backend
+        finally:
+            backend.outstanding -= 1
+
+    async def check_all(self):
+        """
+        Health-check every backend: a failed check opens its circuit, a
+        passing one closes one whose cooldown is over (without clearing
+        failures from real requests). The scheduler then runs OLLAMA_CONCURRENCY
+        generations per backend that is up.
+        """
+        results = await asyncio.gather(*(backend.check() for backend in self.backends))
+        for backend, healthy in zip(self.backends, results):
+            if healthy:
+                backend.breaker.health_check_passed()
+            else:
+                backend.breaker.trip()
+        up = sum(backend.breaker.state != "open" for backend in self.backends)
+        scheduler.resize(OLLAMA_CONCURRENCY * max(1, up))
+
+
+backend_pool = BackendPool(OLLAMA_BACKENDS)
+
+
+def ollama_unavailable_response(error):
+    """
+    Returns: 503 telling the client when Ollama may be worth trying again
+    """
+    return JSONResponse(
+        status_code=503,
+        content={"error": "ollama unavailable", "detail": str(error),
+                 "retry_after": error.retry_after},
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
+
+# ============================================================================
+# OLLAMA CLIENT
+# ============================================================================
+
+@app.on_event("startup")
+async def open_ollama_client():
+    global ollama_client
+    ollama_client = httpx.AsyncClient(
+        timeout=httpx.Timeout(OLLAMA_TIMEOUT, connect=5.0),
+        limits=httpx.Limits(
+            max_connections=OLLAMA_MAX_CONNECTIONS * len(OLLAMA_BACKENDS),
+            max_keepalive_connections=OLLAMA_MAX_CONNECTIONS * len(OLLAMA_BACKENDS),
+            keepalive_expiry=OLLAMA_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+@app.on_event("shutdown")
+async def close_ollama_client():
+    await ollama_client.aclose()
+
+
+backend_checker = None
+
+
+async def check_backends_forever():
+    while True:
+        await backend_pool.check_all()
+        await asyncio.sleep(BACKEND_CHECK_SECONDS)
+
+
+@app.on_event("startup")
+async def start_backend_checker():
+    global backend_checker
+    print(f"🖥 Ollama backends: {', '.join(b.name for b in backend_pool.backends)}")
+    backend_checker = asyncio.create_task(check_backends_forever())
+
+
+@app.on_event("shutdown")
+async def stop_backend_checker():
+    if backend_checker:
+        backend_checker.cancel()
+
+
+# ============================================================================
+# MODEL WARM-UP
+# ============================================================================
+
+# Load seconds per warmed model and backend, and whether each of
+# WARMUP_MODELS is resident on at least one backend
+warmup_state = {"ready": not WARMUP_MODELS, "models": {}}
+warmup_task = None
+
+
+async def warm_up_model(backend, model):
+    """
+    Load `model` into one backend (a generate request with an empty prompt
+    only loads it) and keep it resident for OLLAMA_KEEP_ALIVE
+    Returns: seconds the load took
+    """
+    started = time.monotonic()
+    response = await ollama_client.post(
+        backend.generate_endpoint,
+        json={"model": model, "prompt": "", "stream": False, "keep_alive": OLLAMA_KEEP_ALIVE},
+        timeout=WARMUP_TIMEOUT,
+    )
+    response.raise_for_status()
+    backend.loaded.add(model_name(model))
+    return time.monotonic() - started
+
+
+async def warm_up_backend(backend):
+    pending = list(WARMUP_MODELS)
+    while pending:
+        for model in list(pending):
+            try:
+                seconds = await warm_up_model(backend, model)
+            except httpx.HTTPError as e:
+                print(f"⚠ Warm-up of {model} on {backend.name} failed ({e!r}), "
+                      f"retrying in {WARMUP_RETRY_SECONDS}s")
+                continue
+            warmup_state["models"].setdefault(model, {})[backend.name] = round(seconds, 2)
+            pending.remove(model)
+            print(f"🔥 {model} loaded on {backend.name} in {seconds:.1f}s")
+            # Ready once every model is on some backend; a dead one can't hold /health
+            if all(model in warmup_state["models"] for model in WARMUP_MODELS):
+                warmup_state["ready"] = True
+        if pending:
+            await asyncio.sleep(WARMUP_RETRY_SECONDS)
+
+
+async def warm_up_models():
+    # Backends load in parallel, each on its own GPU
+    await asyncio.gather(*(warm_up_backend(backend) for backend in backend_pool.backends))
+
+
+@app.on_event("startup")
+async def start_warm_up():
+    # In the background: the gateway serves (cold) requests meanwhile
+    global warmup_task
+    if WARMUP_MODELS:
+        warmup_task = asyncio.create_task(warm_up_models())
+
+
+@app.on_event("shutdown")
+async def stop_warm_up():
+    if warmup_task:
+        warmup_task.cancel()
+
+
+class RequestMetricsMiddleware:
+    """
+    Request timings and counts for /metrics. Plain ASGI rather than
+    @app.middleware("http"), which hides client disconnects from endpoints
+    (a batch would then run on for a client that already gave up).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+
+        def endpoint():
+            # Label by route template, not raw path, so unknown URLs can't add series
+            return getattr(scope.get("route"), "path", "unmatched")
+
+        async def send_and_record(message):
+            if message["type"] == "http.response.start":
+                REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint())
+                REQUESTS_TOTAL.inc(endpoint=endpoint(), status=message["status"])
+            await send(message)
+
+        await self.app(scope, receive, send_and_record)
+
+
+app.add_middleware(RequestMetricsMiddleware)
+
+
+def ollama_request(model, prompt, stream, options=None, fmt=None, system=None):
+    """
+    Returns: JSON body for Ollama's /api/generate
+    fmt: "json" or a JSON schema to constrain the output
+    system: static instructions placed ahead of the prompt (see prompt templates)
+    """
+    body = {"model": model, "prompt": prompt, "stream": stream,
+            "keep_alive": OLLAMA_KEEP_ALIVE}
+    if system:
+        body["system"] = system
+    if options:
+        body["options"] = options
+    if fmt:
+        body["format"] = fmt
+    return body
+
+
+def record_ollama_stats(result):
+    """
+    Feed the timing and token fields of a finished generation (Ollama's
+    final response, in nanoseconds) into the metrics
+    """
+    for phase in ("total", "load", "prompt_eval", "eval"):
+        nanoseconds = result.get(f"{phase}_duration")
+        if nanoseconds is not None:
+            OLLAMA_SECONDS.observe(nanoseconds / 1e9, phase=phase)
+    for kind, field in (("prompt", "prompt_eval_count"), ("eval", "eval_count")):
+        if result.get(field) is not None:
+            OLLAMA_TOKENS.observe(result[field], kind=kind)
+
+
+async def ollama_generate(model, prompt, options=None, fmt=None, system=None):
+    """
+    Run one non-streamed generation on a pooled Ollama backend without
+    blocking the event loop, through its circuit breaker and adaptive timeout
+    Returns: Ollama's response dict
+    Raises: OllamaUnavailable
+    """
+    tried = set()
+    while True:
+        async with backend_pool.backend(model, exclude=tried) as backend:
+            timeout = backend.timeout.for_prompt(prompt, system)
+            try:
+                response = await ollama_client.post(
+                    backend.generate_endpoint,
+                    json=ollama_request(model, prompt, False, options, fmt, system),
+                    timeout=httpx.Timeout(timeout, connect=5.0),
+                )
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                # Never reached Ollama, so another backend can safely take it
+                backend.breaker.record_failure("connection")
+                tried.add(backend)
+                continue
+            except httpx.TimeoutException:
+                backend.breaker.record_failure("timeout")
+                raise OllamaUnavailable(f"Ollama on {backend.name} timed out after {timeout}s",
+                                        backend_pool.retry_after())
+            except httpx.TransportError as e:
+                backend.breaker.record_failure("connection")
+                raise OllamaUnavailable(f"Ollama on {backend.name} failed: {e!r}",
+                                        backend_pool.retry_after())
+            if response.status_code >= 500:
+                backend.breaker.record_failure("server_error")
+                raise OllamaUnavailable(f"Ollama on {backend.name} returned HTTP "
+                                        f"{response.status_code}", backend_pool.retry_after())
+            
+            result = response.json()
+            # A 4xx (unknown model, bad request) says nothing about the backend's health
+            if response.status_code == 200:
+                backend.breaker.record_success()
+                backend.loaded.add(model_name(model))
+                backend.timeout.observe(result)
+                record_ollama_stats(result)
+            return result
+
+
+async def generate(model, prompt, priority, options=None, use_cache=False, fmt=None,
+                   system=None):
+    """
+    Generate through the response cache (if use_cache; only JSON-object
+    answers are stored) and the scheduler
+    Returns: (Ollama response dict, cache status "HIT"/"MISS"/"BYPASS", age seconds)
+    Raises: QueueFull, OllamaUnavailable
+    """
+    key = ResponseCache.make_key(model, prompt, options, fmt, system) if use_cache else None
+    if key:
+        cached = await response_cache.get(key)
+        # Entries stored before answers were checked may be bad: regenerate those
+        if cached and cacheable(cached[0]["response"], fmt):
+            # Hits never touch the GPU queue
+            return cached[0], "HIT", cached[1]
+    
+    # Fail fast while Ollama is down rather than queueing for it
+    backend_pool.ensure_available()
+    async with scheduler.slot(priority):
+        result = await ollama_generate(model, prompt, options, fmt, system)
+    
+    if key:
+        if cacheable(result.get("response", ""), fmt):
+            await response_cache.put(key, model, result)
+        return result, "MISS", 0
+    return result, "BYPASS", 0
+
+
+async def ollama_stream(model, prompt, options=None, system=None):
+    """
+    Run a streamed generation on a pooled Ollama backend
+    Yields: Ollama's raw NDJSON lines, one per token batch, ending with "done": true
+    Raises: OllamaUnavailable (before or during the stream)
+    
+    Leaving the loop early closes the connection, which makes Ollama stop generating.
+    The adaptive timeout applies to each read: the first one waits for prompt eval.
+    """
+    tried = set()
+    while True:
+        async with backend_pool.backend(model, exclude=tried) as backend:
+            timeout = backend.timeout.for_prompt(prompt, system)
+            try:
+                async with ollama_client.stream(
+                    "POST",
+                    backend.generate_endpoint,
+                    json=ollama_request(model, prompt, True, options, system=system),
+                    timeout=httpx.Timeout(timeout, connect=5.0),
+                ) as response:
+                    if response.status_code >= 500:
+                        backend.breaker.record_failure("server_error")
+                        raise OllamaUnavailable(f"Ollama on {backend.name} returned HTTP "
+                                                f"{response.status_code}",
+                                                backend_pool.retry_after())
+                    async for line in response.aiter_lines():
+                        if line:
+                            # Only the final chunk of a 200 carries timings and token counts
+                            if response.status_code == 200 and '"eval_count"' in line:
+                                final = json.loads(line)
+                                backend.breaker.record_success()
+                                backend.loaded.add(model_name(model))
+                                backend.timeout.observe(final)
+                                record_ollama_stats(final)
+                            yield line
+                return
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                # Nothing was sent yet, so another backend can safely take it
+                backend.breaker.record_failure("connection")
+                tried.add(backend)
+            except httpx.TimeoutException:
+                backend.breaker.record_failure("timeout")
+                raise OllamaUnavailable(f"Ollama on {backend.name} stalled for {timeout}s",
+                                        backend_pool.retry_after())
+            except httpx.TransportError as e:
+                backend.breaker.record_failure("connection")
+                raise OllamaUnavailable(f"Ollama on {backend.name} failed: {e!r}",
+                                        backend_pool.retry_after())
+
+
+def stream_mode(payload):
+    """
+    Returns: "ndjson", "sse", or None for a normal JSON response
+    Opt in with "stream": true (NDJSON), "stream": "ndjson" or "stream": "sse"
+    """
+    stream = payload.get("stream")
+    if stream in ("sse", "ndjson"):
+        return stream
+    return "ndjson" if stream is True else None
+
+
+async def streaming_response(model, prompt, priority, mode, on_complete=None,
+                             options=None, use_cache=False, system=None):
+    """
+    Proxy Ollama's token stream to the client as NDJSON or server-sent events.
+    The scheduler slot is held for the life of the stream and released as
+    soon as the client disconnects.
+    
+    With use_cache, a cache hit is sent as a single final chunk, and a
+    stream that runs to "done" with a JSON object is stored for next time. on_complete gets
+    Ollama's final chunk (timings and token counts).
+    
+    Raises: QueueFull or OllamaUnavailable before any bytes are sent, so
+    callers can still 429/503; later failures end the stream with an error chunk
+    """
+    def frame(line):
+        return f"data: {line}\n\n" if mode == "sse" else line + "\n"
+    
+    media_type = "text/event-stream" if mode == "sse" else "application/x-ndjson"
+    key = ResponseCache.make_key(model, prompt, options, system=system) if use_cache else None
+    
+    if key:
+        cached = await response_cache.get(key)
+        if cached and cacheable(cached[0]["response"]):
+            line = json.dumps({"model": model, "response": cached[0]["response"], "done": True})
+            return StreamingResponse(iter([frame(line)]), media_type=media_type,
+                                     headers={"X-Cache": "HIT", "Age": str(int(cached[1]))})
+    
+    backend_pool.ensure_available()
+    scheduler.check_admission()
+    
+    async def body():
+        tokens = []
+        final = {}
+        try:
+            async with scheduler.slot(priority):
+                async for line in ollama_stream(model, prompt, options, system):
+                    if key or '"eval_count"' in line:
+                        chunk = json.loads(line)
+                        tokens.append(chunk.get("response", ""))
+                        if chunk.get("done"):
+                            final = chunk
+                            if key and cacheable("".join(tokens)):
+                                await response_cache.put(key, model, {"response": "".join(tokens)})
+                    yield frame(line)
+        except QueueFull as e:
+            # Lost the race for the last queue spot after admission
+            yield frame(json.dumps({"error": "queue full", "retry_after": e.retry_after, "done": True}))
+            return
+        except OllamaUnavailable as e:
+            yield frame(json.dumps({"error": "ollama unavailable", "detail": str(e),
+                                    "retry_after": e.retry_after, "done": True}))
+            return
+        if on_complete:
+            on_complete(final)
+    
+    return StreamingResponse(body(), media_type=media_type,
+                             headers={"X-Cache": "MISS" if key else "BYPASS"})
+
+
+# ============================================================================
+# STRUCTURED OUTPUT
+# ============================================================================
+
+JSON_TYPES = {
+    "string": str, "boolean": bool, "array": list, "object": dict,
+    "number": (int, float), "integer": int, "null": type(None),
+}
+
+# Counters for /status: how often schema repair replaced a full regeneration
+structured_stats = {"requests": 0, "valid_first_try": 0, "repaired": 0,
+                    "fields_repaired": 0, "failed": 0}
+
+
+def type_matches(value, name):
+    """
+    Returns: True if value is of JSON type `name` (types we don't know pass)
+    """
+    if name not in JSON_TYPES:
+        return True
+    # bool is an int subclass in Python, but not a JSON number
+    if name in ("number", "integer") and isinstance(value, bool):
+        return False
+    return isinstance(value, JSON_TYPES[name])
+
+
+def value_matches(value, spec):
+    """
+    Returns: True if value satisfies the (small) subset of JSON Schema we use:
+    type (a name or a list of them), enum and array items
+    """
+    if not isinstance(spec, dict):
+        return True
+    expected = spec.get("type")
+    names = expected if isinstance(expected, list) else [expected] if expected else []
+    if names and not any(type_matches(value, name) for name in names):
+        return False
+    if "enum" in spec and value not in spec["enum"]:
+        return False
+    if isinstance(value, list) and "items" in spec:
+        return all(value_matches(item, spec["items"]) for item in value)
+    return True
+
+
+def schema_problems(data, schema):
+    """
+    Returns: names of top-level fields that are missing or invalid
+    """
+    properties = schema.get("properties", {})
+    problems = [name for name in schema.get("required", []) if name not in data]
+    problems += [name for name, spec in properties.items()
+                 if name in data and not value_matches(data[name], spec)]
+    return problems
+
+
+def parse_json_object(text):
+    """
+    Returns: dict parsed from LLM output, or {} if it isn't a JSON object
+    """
+    try:
+        data = json.loads(text.strip())
+    except json.JSONDecodeError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+async def generate_structured(model, prompt, schema, priority, options=None, use_cache=False,
+                              system=None):
+    """
+    Generate JSON constrained to `schema`, validate it, and re-ask only for
+    fields that are missing or invalid (up to STRUCTURED_REPAIR_ATTEMPTS)
+    Returns: (dict with data/valid/missing/repairs, cache status, age seconds);
+    the dict's "tokens" holds Ollama's token counts summed over every attempt
+    Raises: QueueFull, OllamaUnavailable
+    """
+    structured_stats["requests"] += 1
+    result, cache_status, age = await generate(model, prompt, priority, options,
+                                               use_cache, fmt=schema, system=system)
+    tokens = {field: result.get(field) or 0 for field in ("prompt_eval_count", "eval_count")}
+    data = parse_json_object(result.get("response", ""))
+    problems = schema_problems(data, schema)
+    if not problems:
+        structured_stats["valid_first_try"] += 1
+    
+    repairs = 0
+    while problems and repairs < STRUCTURED_REPAIR_ATTEMPTS:
+        repairs += 1
+        structured_stats["fields_repaired"] += len(problems)
+        
+        # Ask for just the broken fields, constrained to their own sub-schema
+        sub_schema = {
+            "type": "object",
+            "properties": {name: schema["properties"][name] for name in problems
+                           if name in schema.get("properties", {})},
+            "required": problems,
+        }
+        good = {name: value for name, value in data.items() if name not in problems}
+        repair_prompt = (
+            f"{prompt}\n\nYour previous answer was: {json.dumps(good)}\n"
+            f"It is missing or has invalid values for: {', '.join(problems)}.\n"
+            f"Respond ONLY with a JSON object containing just those fields."
+        )
+        async with scheduler.slot(priority):
+            repair = await ollama_generate(model, repair_prompt, options, sub_schema, system)
+        for field in tokens:
+            tokens[field] += repair.get(field) or 0
+        
+        data.update({name: value for name, value in
+                     parse_json_object(repair.get("response", "")).items()
+                     if name in problems})
+        problems = schema_problems(data, schema)
+    
+    if repairs and not problems:
+        structured_stats["repaired"] += 1
+    if problems:
+        structured_stats["failed"] += 1
+    elif repairs and use_cache:
+        # Cache the repaired answer so the next identical request is one lookup
+        await response_cache.put(ResponseCache.make_key(model, prompt, options, schema, system),
+                                 model, {"response": json.dumps(data)})
+    
+    return {
+        "response": json.dumps(data),
+        "data": data,
+        "valid": not problems,
+        "missing": problems,
+        "repairs": repairs,
+        "tokens": tokens,
+    }, cache_status, age
+
+
+# ============================================================================
+# PROMPT TEMPLATES
+# ============================================================================
+
+# template id -> static instruction text, least recently used first
+prompt_templates = OrderedDict()
+
+
+class UnknownTemplate(Exception):
+    """Raised for a template id that was never registered (or was evicted)"""
+
+
+def resolve_system(payload):
+    """
+    Returns: the static instructions for this request: the registered
+    "template", or a literal "system" string, or None
+    Raises: UnknownTemplate
+    """
+    template = payload.get("template")
+    if template:
+        if template not in prompt_templates:
+            raise UnknownTemplate(template)
+        prompt_templates.move_to_end(template)
+        return prompt_templates[template]
+    return payload.get("system") or None
+
+
+def unknown_template_response(error):
+    """
+    Returns: 404 telling the client to register its template again
+    (templates live in memory, so a gateway restart forgets them)
+    """
+    return JSONResponse(status_code=404,
+                        content={"error": "unknown template", "template": str(error)})
+
+
+@app.post("/api/templates")
+async def register_template(payload: dict):
+    """
+    Register static instructions to reuse across requests
+    Expects: {"system": "instructions shared by every request"}
+    Returns: {"template": id} to send as "template" with /api/analyze(/batch)
+    
+    The id is a hash of the text, so registering the same text again is
+    harmless and returns the same id
+    """
+    system = payload.get("system", "").strip()
+    if not system:
+        return JSONResponse(status_code=400, content={"error": "system text required"})
+    
+    template = hashlib.sha256(system.encode()).hexdigest()[:16]
+    prompt_templates[template] = system
+    prompt_templates.move_to_end(template)
+    while len(prompt_templates) > MAX_PROMPT_TEMPLATES:
+        prompt_templates.popitem(last=False)
+    return {"template": template}
 
-# Track recent processing for status widget
-# In production, use Redis or similar
-job_history = deque(maxlen=100)  # Keep last 100 jobs
 
 # ============================================================================
 # EXISTING ENDPOINTS (Keep these as-is)
 # ============================================================================
 
 @app.post("/api/review")
-async def review_segment(payload: dict):
+async def review_segment(payload: dict, response: Response):
     """
     Original content flagging endpoint
     Expects: {"text": "transcript segment", "guidelines": "what to flag for"}
     Returns: {"flagged": bool, "reason": str}
+             503 with Retry-After if Ollama is down
+    
+    Scheduled as interactive unless the payload says "priority": "batch"
+    With "stream": true/"sse", proxies raw tokens instead (client parses the verdict)
+    "cache": true/false overrides RESPONSE_CACHE_ENABLED for this request
     """
     text = payload.get("text", "").strip()
     guidelines = payload.get("guidelines", "flag anything harmful or inappropriate")
@@ -54,13 +1590,27 @@ Guidelines: {guidelines}
 Segment: "{text}"
 Respond ONLY with JSON (no markdown): {{"flagged": true/false, "reason": "brief explanation or empty string"}}"""
     
-    response = requests.post(
-        OLLAMA_ENDPOINT,
-        json={"model": "mistral", "prompt": prompt, "stream": False},
-        timeout=60
-    )
+    priority = request_priority(payload, PRIORITY_INTERACTIVE)
+    mode = stream_mode(payload)
+    if mode:
+        try:
+            return await streaming_response("mistral", prompt, priority, mode,
+                                            use_cache=cache_requested(payload))
+        except QueueFull as e:
+            return queue_full_response(e)
+        except OllamaUnavailable as e:
+            return ollama_unavailable_response(e)
+    
+    try:
+        result, cache_status, age = await generate(
+            "mistral", prompt, priority, use_cache=cache_requested(payload)
+        )
+    except QueueFull as e:
+        return queue_full_response(e)
+    except OllamaUnavailable as e:
+        return ollama_unavailable_response(e)
+    set_cache_headers(response, cache_status, age)
     
-    result = response.json()
     response_text = result.get("response", "").strip()
     
     # Parse JSON from response
@@ -72,112 +1622,413 @@ Respond ONLY with JSON (no markdown): {{"flagged": true/false, "reason": "brief
 
 
 @app.post("/api/analyze")
-async def analyze_text(payload: dict):
+async def analyze_text(payload: dict, response: Response):
     """
     Generic LLM analysis endpoint (added for Catalyst demo)
-    Expects: {"prompt": "full prompt text", "model": "mistral"}
+    Expects: {"prompt": "full prompt text", "model": "mistral", "options": {...},
+              "schema": {...JSON schema, optional...},
+              "template": "id from /api/templates, optional"}
     Returns: {"response": "raw LLM output"}
+             with "schema": {"response", "data", "valid", "missing", "repairs"}
+             400 {"error": ...} if "schema" isn't a JSON object
+             404 {"error": "unknown template"} if the template must be re-registered
+             503 with Retry-After if Ollama is down
+    
+    With "template", "prompt" holds only the per-request text; the registered
+    instructions go ahead of it as Ollama's system prompt
+    Scheduled as batch work unless the payload says "priority": "interactive"
+    With "stream": true/"sse", returns Ollama's token stream as NDJSON/SSE
+    (ignored with "schema": validation needs the whole answer)
+    "cache": true/false overrides RESPONSE_CACHE_ENABLED for this request
     """
     prompt = payload.get("prompt", "").strip()
     model = payload.get("model", "mistral")
+    options = payload.get("options")
+    schema = payload.get("schema")
+    use_cache = cache_requested(payload)
     
     if not prompt:
         return {"response": ""}
+    if schema is not None and not isinstance(schema, dict):
+        return JSONResponse(status_code=400, content={"error": "schema must be an object"})
     
-    response = requests.post(
-        OLLAMA_ENDPOINT,
-        json={"model": model, "prompt": prompt, "stream": False},
-        timeout=60
-    )
+    try:
+        system = resolve_system(payload)
+    except UnknownTemplate as e:
+        return unknown_template_response(e)
     
-    result = response.json()
-    response_text = result.get("response", "").strip()
+    started = time.monotonic()
     
-    # Log this job for status tracking
-    job_history.append({
-        "timestamp": datetime.utcnow().isoformat(),
-        "model": model,
-        "success": True
-    })
+    def log_job(result=None):
+        # Record this job for status tracking
+        record_job(started, model=model, result=result)
+    
+    priority = request_priority(payload, PRIORITY_BATCH)
+    
+    if schema:
+        try:
+            structured, cache_status, age = await generate_structured(
+                model, prompt, schema, priority, options, use_cache, system
+            )
+        except QueueFull as e:
+            return queue_full_response(e)
+        except OllamaUnavailable as e:
+            record_job(started, success=False, model=model)
+            return ollama_unavailable_response(e)
+        except Exception:
+            record_job(started, success=False, model=model)
+            raise
+        set_cache_headers(response, cache_status, age)
+        record_job(started, success=structured["valid"], model=model,
+                   result=structured.pop("tokens"), cache_hit=cache_status == "HIT")
+        return structured
+    
+    mode = stream_mode(payload)
+    if mode:
+        try:
+            return await streaming_response(model, prompt, priority, mode, on_complete=log_job,
+                                            options=options, use_cache=use_cache,
+                                            system=system)
+        except QueueFull as e:
+            return queue_full_response(e)
+        except OllamaUnavailable as e:
+            return ollama_unavailable_response(e)
+    
+    try:
+        result, cache_status, age = await generate(model, prompt, priority, options, use_cache,
+                                                   system=system)
+    except QueueFull as e:
+        return queue_full_response(e)
+    except OllamaUnavailable as e:
+        record_job(started, success=False, model=model)
+        return ollama_unavailable_response(e)
+    except Exception:
+        record_job(started, success=False, model=model)
+        raise
+    set_cache_headers(response, cache_status, age)
+    
+    response_text = result.get("response", "").strip()
+    record_job(started, model=model, result=result, cache_hit=cache_status == "HIT")
     
     return {"response": response_text}
 
 
 # ============================================================================
-# NEW: PUBLIC STATUS ENDPOINT (For the demo widget)
+# BATCH ANALYSIS
 # ============================================================================
 
-@app.get("/status")
-async def public_status():
+def build_batch_prompt(instructions, text):
     """
-    Public status endpoint - no authentication required
-    Shows infrastructure is alive without exposing sensitive info
+    Returns: prompt with the item text substituted for {transcript},
+    or appended after the instructions if there is no placeholder
+    """
+    if "{transcript}" in instructions:
+        return instructions.replace("{transcript}", text)
+    return f"{instructions}\n\n{text}"
+
+
+async def cancel_on_disconnect(request, tasks):
+    """
+    Cancel `tasks` if the client disconnects before they all finish
+    """
+    while not all(task.done() for task in tasks):
+        if await request.is_disconnected():
+            for task in tasks:
+                task.cancel()
+            return
+        await asyncio.sleep(BATCH_DISCONNECT_POLL_SECONDS)
+
+
+@app.post("/api/analyze/batch")
+async def analyze_batch(payload: dict, request: Request):
+    """
+    Analyze many texts with one shared instruction block in a single request
+    Expects: {"instructions": "prompt with {transcript} placeholder",
+              "items": [{"id": "spark-1", "text": "..."}, ...],
+              "model": "mistral", "options": {...}, "schema": {...optional...},
+              "template": "id from /api/templates, optional",
+              "stream": false, "cache": false}
+    Returns: {"results": [{"id": ..., "response": "raw LLM output", "cached": bool}
+                          (plus data/valid/missing/repairs with "schema")
+                          or {"id": ..., "error": "..."}]} in request order,
+             or with "stream": true one NDJSON result line per item as each finishes
+             400 {"error": ...} if instructions/items aren't shaped as above
     
-    This is what the React status widget polls every 30 seconds
+    Items run as batch priority, at most BATCH_CONCURRENCY at a time. With
+    "template", its instructions go to Ollama as the system prompt ahead of
+    each item's instructions + text.
     """
+    instructions = payload.get("instructions", "")
+    items = payload.get("items", [])
+    model = payload.get("model", "mistral")
+    options = payload.get("options")
+    schema = payload.get("schema")
+    use_cache = cache_requested(payload)
     
-    # Get last processed job timestamp
-    last_processed = None
-    if job_history:
-        last_processed = job_history[-1]["timestamp"]
+    if not isinstance(instructions, str):
+        return JSONResponse(status_code=400, content={"error": "instructions must be a string"})
+    if not isinstance(items, list) or not all(
+            isinstance(item, dict) and isinstance(item.get("text"), str) for item in items):
+        return JSONResponse(
+            status_code=400,
+            content={"error": 'items must be a list of {"id": ..., "text": "..."} objects'},
+        )
+    if schema is not None and not isinstance(schema, dict):
+        return JSONResponse(status_code=400, content={"error": "schema must be an object"})
     
-    # Calculate queue depth (for demo, always 0 since we process synchronously)
-    queue_depth = 0
+    if len(items) > MAX_BATCH_ITEMS:
+        return JSONResponse(
+            status_code=413,
+            content={"error": f"batch too large (max {MAX_BATCH_ITEMS} items)"},
+        )
     
-    # Calculate average processing time from recent jobs
-    # For demo purposes, hardcode this - in production track actual times
-    avg_processing_time = "58 seconds"
+    try:
+        system = resolve_system(payload)
+    except UnknownTemplate as e:
+        return unknown_template_response(e)
     
-    # Count successful jobs in last hour (optional metric)
-    recent_jobs = len([j for j in job_history 
-                      if (datetime.utcnow() - datetime.fromisoformat(j["timestamp"])).seconds < 3600])
+    # Refuse the whole batch up front rather than half-running it
+    try:
+        backend_pool.ensure_available()
+        scheduler.check_admission()
+    except QueueFull as e:
+        return queue_full_response(e)
+    except OllamaUnavailable as e:
+        return ollama_unavailable_response(e)
+    
+    limit = asyncio.Semaphore(BATCH_CONCURRENCY)
+    
+    async def run_item(item):
+        started = time.monotonic()
+        prompt = build_batch_prompt(instructions, item.get("text", "").strip())
+        async with limit:
+            while True:
+                try:
+                    if schema:
+                        result, cache_status, _ = await generate_structured(
+                            model, prompt, schema, PRIORITY_BATCH, options, use_cache, system
+                        )
+                    else:
+                        result, cache_status, _ = await generate(
+                            model, prompt, PRIORITY_BATCH, options, use_cache, system=system
+                        )
+                    break
+                except QueueFull as e:
+                    # Interactive traffic filled the queue; wait our turn
+                    await asyncio.sleep(min(e.retry_after, 5))
+                except Exception as e:
+                    record_job(started, success=False, endpoint="/api/analyze/batch",
+                               model=model)
+                    return {"id": item.get("id"), "error": str(e)}
+        
+        record_job(started, success=result.get("valid", True), endpoint="/api/analyze/batch",
+                   model=model, result=result.get("tokens", result),
+                   cache_hit=cache_status == "HIT")
+        item_result = {
+            "id": item.get("id"),
+            "response": result.get("response", "").strip(),
+            "cached": cache_status == "HIT",
+        }
+        if schema:
+            item_result.update({key: result[key] for key in
+                                ("data", "valid", "missing", "repairs")})
+        return item_result
+    
+    tasks = [asyncio.create_task(run_item(item)) for item in items]
+    
+    if stream_mode(payload):
+        async def body():
+            try:
+                for finished in asyncio.as_completed(tasks):
+                    yield json.dumps(await finished) + "\n"
+            finally:
+                # Client went away: don't keep the GPU busy for nobody
+                for task in tasks:
+                    task.cancel()
+        return StreamingResponse(body(), media_type="application/x-ndjson")
+    
+    watcher = asyncio.create_task(cancel_on_disconnect(request, tasks))
+    try:
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        # Also when this handler itself is cancelled: don't keep the GPU busy for nobody
+        watcher.cancel()
+        for task in tasks:
+            task.cancel()
+    if any(isinstance(result, asyncio.CancelledError) for result in results):
+        # The client went away; nobody is left to read the results
+        return Response(status_code=499)
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    return {"results": results}
+
+
+# ============================================================================
+# PUBLIC STATUS AND MONITORING
+# ============================================================================
+
+# Latest /status body, its ETag, and the task rebuilding it
+status_snapshot = {"body": None, "etag": None}
+status_refresher = None
+_status_refresh_lock = asyncio.Lock()
+
+
+async def build_status():
+    """
+    Returns: the public status dict
+    """
+    hour = jobs_last_hour.totals()
+    
+    # Requests waiting for an Ollama slot right now
+    queue_depth = scheduler.queue_depth
+    
+    # Average time recent requests spent waiting for a slot
+    avg_queue_wait = (sum(scheduler.wait_times) / len(scheduler.wait_times)
+                      if scheduler.wait_times else 0.0)
+    
+    # Average job time over the last hour, else Ollama's average since startup
+    generations = OLLAMA_SECONDS.summary(phase="total")
+    avg_seconds = hour['avg_latency'] or (generations['avg'] if generations else None)
+    avg_processing_time = f"{avg_seconds:.1f} seconds" if avg_seconds is not None else "n/a"
+    
+    # Health comes from the backend checker and circuit breakers
+    if any(backend.breaker.state == "open" for backend in backend_pool.backends):
+        status = "degraded"
+    else:
+        status = "online" if warmup_state["ready"] else "warming"
     
     return {
-        "status": "online",  # Could check Ollama health here if desired
-        "last_processed": last_processed,
+        "status": status,
+        "last_processed": last_processed(),
         "queue_depth": queue_depth,
+        "running": scheduler.running,
+        "avg_queue_wait": f"{avg_queue_wait:.1f} seconds",
+        "estimated_wait": f"{scheduler.estimate_wait():.0f} seconds" if queue_depth else "0 seconds",
         "hardware": "GTX 1060 6GB",
         "location": "Michigan",
         "avg_processing_time": avg_processing_time,
-        "jobs_last_hour": recent_jobs  # Optional: shows activity level
+        "jobs_last_hour": hour['count'],  # Optional: shows activity level
+        "jobs_last_day": jobs_last_day.totals()['count'],
+        "success_rate_last_hour": hour['success_rate'],
+        # Circuit state only: hosts, load and models are on /metrics
+        "backends": [backend.breaker.state for backend in backend_pool.backends],
+        "response_cache": response_cache.stats(),
+        "structured_output": structured_stats,
+        "generated_at": datetime.utcnow().isoformat(),
     }
 
 
+async def refresh_status():
+    """
+    Rebuild the snapshot; callers that arrive while a rebuild is running
+    wait for it instead of starting their own
+
+    The ETag covers everything except generated_at, and an unchanged
+    snapshot keeps its previous body, so a quiet gateway keeps answering
+    the widget's polls with 304s.
+    """
+    in_progress = _status_refresh_lock.locked()
+    async with _status_refresh_lock:
+        if in_progress and status_snapshot["body"] is not None:
+            return
+        status = await build_status()
+        generated_at = status.pop("generated_at")
+        content = json.dumps(status, sort_keys=True).encode()
+        etag = '"' + hashlib.blake2b(content, digest_size=8).hexdigest() + '"'
+        if etag == status_snapshot["etag"]:
+            return
+        status["generated_at"] = generated_at
+        status_snapshot["body"] = json.dumps(status).encode()
+        status_snapshot["etag"] = etag
+
+
+async def refresh_status_forever():
+    while True:
+        try:
+            await refresh_status()
+        except Exception as e:
+            print(f"⚠ Status refresh failed: {e}")
+        await asyncio.sleep(STATUS_REFRESH_SECONDS)
+
+
+@app.on_event("startup")
+async def start_status_refresher():
+    global status_refresher
+    status_refresher = asyncio.create_task(refresh_status_forever())
+
+
+@app.on_event("shutdown")
+async def stop_status_refresher():
+    if status_refresher:
+        status_refresher.cancel()
+
+
+@app.get("/status")
+async def public_status(request: Request):
+    """
+    Public status endpoint - no authentication required
+    Shows infrastructure is alive without exposing sensitive info
+    
+    This is what the React status widget polls every 30 seconds. It returns
+    the latest precomputed snapshot (304 if the client's ETag still matches),
+    so a traffic spike costs a dictionary lookup, not handler logic.
+    """
+    if status_snapshot["body"] is None:
+        # First request after startup: share the refresher's first build
+        await refresh_status()
+    
+    headers = {
+        "ETag": status_snapshot["etag"],
+        "Cache-Control": f"public, max-age={STATUS_MAX_AGE}",
+    }
+    if request.headers.get("if-none-match") == status_snapshot["etag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=status_snapshot["body"], media_type="application/json",
+                    headers=headers)
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus scrape endpoint: request latency, queue wait, and Ollama
+    durations/token counts since startup, plus each backend's load, circuit
+    state and loaded models right now
+    """
+    BACKEND_LOADED.clear()  # models unloaded since the last scrape
+    for backend in backend_pool.backends:
+        backend.record_gauges()
+    return PlainTextResponse(catalyst_metrics.registry.render(),
+                             media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/jobs/stats")
+async def job_stats(hours: float = 24, since: float = None, until: float = None):
+    """
+    Per-model job stats from the job store (survives restarts)
+    Query: ?hours=24, or ?since=<unix time>&until=<unix time>
+    Returns: {"since", "until", "models": [{"model", "jobs", "failures",
+              "cache_hits", "avg_latency", "max_latency", "prompt_tokens", "eval_tokens"}]}
+    """
+    if until is None:
+        until = time.time()
+    if since is None:
+        since = until - hours * 3600
+    # Include jobs still waiting for the next batch write
+    await job_store.flush()
+    models = await asyncio.to_thread(job_store.stats, since, until)
+    return {"since": datetime.utcfromtimestamp(since).isoformat(),
+            "until": datetime.utcfromtimestamp(until).isoformat(),
+            "models": models}
+
+
 @app.get("/health")
 async def health():
     """
-    Simple health check
-    """
-    return {"status": "ok"}
-
-
-# ============================================================================
-# OPTIONAL: Ollama health check (uncomment if you want to verify Ollama is up)
-# ============================================================================
-
-# @app.get("/status")
-# async def public_status():
-#     """Version with Ollama health check"""
-#     
-#     # Check if Ollama is responding
-#     ollama_healthy = False
-#     try:
-#         check = requests.get("http://localhost:11434/api/tags", timeout=2)
-#         ollama_healthy = check.status_code == 200
-#     except:
-#         pass
-#     
-#     status = "online" if ollama_healthy else "degraded"
-#     
-#     last_processed = None
-#     if job_history:
-#         last_processed = job_history[-1]["timestamp"]
-#     
-#     return {
-#         "status": status,
-#         "last_processed": last_processed,
-#         "queue_depth": 0,
-#         "hardware": "GTX 1060 6GB",
-#         "location": "Michigan",
-#         "avg_processing_time": "58 seconds"
-#     }
+    Readiness check: 503 "warming" until each of WARMUP_MODELS is loaded on a backend
+    Returns: {"status": "ok"/"warming", "models": {model: {backend: load seconds}}}
+    """
+    if not warmup_state["ready"]:
+        return JSONResponse(status_code=503,
+                            content={"status": "warming", "models": warmup_state["models"]})
+    return {"status": "ok", "models": warmup_state["models"]}
@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+"""
+Pipeline Benchmark - per-stage latency, throughput, retries and peak memory
+for catalyst_demo_v2, with no dependency on wcn-oglaptop
+
+Generates synthetic Spark audio (speech-like bursts separated by silence),
+starts mock_ollama.py as a stand-in for Ollama and the gateway
+(ollama_api_updated.py) in front of it, then runs the staged pipeline over
+the fixtures. Results are written as JSON so runs can be compared.
+
+Single-shot analysis goes to /api/analyze (streamed, or schema-constrained
+with --analysis structured): this repo's /api/review wraps its text in the
+content-review prompt, so it does not stand in for the laptop's endpoint.
+
+Prompt evaluation (tokens Ollama actually read and seconds it took, per
+generation) is taken from the gateway's /metrics, so runs with and without
+--no-prefix-template show what the registered instruction template saves.
+
+Cold start: with --load-seconds the mock takes that long to load a model
+that isn't resident. The gateway warms Mistral up before it reports healthy
+(skip with --no-warmup), and first_result_seconds shows what the first
+Spark waits either way.
+
+Several Ollama hosts: --backends N starts N mocks behind the gateway's
+backend pool (OLLAMA_BACKENDS), and backend_requests shows how the
+generations were spread.
+
+Usage: python pipeline_benchmark.py --sparks 8 --latency 0.5 --tokens-per-second 40
+       python pipeline_benchmark.py --skip-whisper --malformed-rate 0.1 --compare last.json
+       python pipeline_benchmark.py --skip-whisper --no-prefix-template --json before.json
+       python pipeline_benchmark.py --skip-whisper --load-seconds 5 --no-warmup
+       python pipeline_benchmark.py --skip-whisper --backends 3
+       python pipeline_benchmark.py --gateway http://localhost:8000   (use a running gateway)
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import wave
+import re
+import random
+import struct
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+from pathlib import Path
+from datetime import datetime, timedelta
+
+try:
+    import resource  # Peak RSS (not available on Windows)
+except ImportError:
+    resource = None
+
+import catalyst_demo_v2 as catalyst
+from mock_ollama import start_mock_ollama
+
+RESULTS_DIR = Path("benchmark-results")
+
+# Words for synthetic transcripts (--skip-whisper)
+VOCABULARY = ("today I noticed that the way we plan the week changes how much energy "
+              "is left for the work that matters and I want to try blocking mornings "
+              "for deep focus then review what moved on friday").split()
+
+# Metrics compared by --compare, and whether higher is better
+COMPARED_METRICS = {
+    'sparks_per_minute': True,
+    'wall_seconds': False,
+    'first_result_seconds': False,
+    'peak_rss_mb': False,
+    'analysis.full_retries': False,
+    'prompt_eval.avg_tokens': False,
+    'prompt_eval.avg_seconds': False,
+}
+
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+def write_fixture(path, seconds, rng):
+    """
+    Write a 16 kHz mono WAV of voiced bursts (a few harmonics with a
+    syllable-rate envelope) separated by silences, so decode and VAD do real work
+    """
+    rate = catalyst.WHISPER_SAMPLE_RATE
+    frames = bytearray()
+    t = 0.0
+    while t < seconds:
+        burst = min(rng.uniform(1.5, 6.0), seconds - t)
+        pitch = rng.uniform(110, 220)
+        for n in range(int(burst * rate)):
+            x = n / rate
+            envelope = 0.5 + 0.5 * math.sin(2 * math.pi * 4 * x)
+            sample = sum(math.sin(2 * math.pi * pitch * k * x) / k for k in (1, 2, 3))
+            frames += struct.pack("<h", int(6000 * envelope * sample))
+        t += burst
+        silence = min(rng.uniform(0.5, 8.0), max(seconds - t, 0))
+        frames += b"\0\0" * int(silence * rate)
+        t += silence
+
+    with wave.open(str(path), "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(rate)
+        out.writeframes(bytes(frames))
+
+
+def make_fixtures(directory, count, seconds, seed):
+    """
+    Returns: sorted list of fixture paths named like real Replay captures
+    (kept per length and seed, so later runs reuse them)
+    """
+    rng = random.Random(seed)
+    directory = directory / f"{seconds:g}s-seed{seed}"
+    directory.mkdir(parents=True, exist_ok=True)
+    start = datetime(2025, 1, 6, 9, 0, 0)
+    paths = []
+    for i in range(count):
+        stamp = (start + timedelta(hours=i)).strftime("%Y-%m-%d %H-%M-%S")
+        path = directory / f"Replay {stamp}.wav"
+        if not path.exists():
+            write_fixture(path, seconds, rng)
+        paths.append(path)
+    return paths
+
+
+def synthetic_transcriber(words_per_minute, seed):
+    """
+    Stand-in for Whisper: segments of random words at a speaking rate,
+    sized from each fixture's length, so analysis load stays realistic
+    Returns: transcriber(path, on_segment=None) -> (segments, duration)
+    """
+    def transcriber(spark_file, on_segment=None):
+        with wave.open(str(spark_file), "rb") as audio:
+            duration = audio.getnframes() / audio.getframerate()
+        rng = random.Random(f"{seed}:{Path(spark_file).name}")
+        segments = []
+        for start in range(0, int(duration), 10):
+            words = [rng.choice(VOCABULARY) for _ in range(int(words_per_minute / 6))]
+            segment = {'start': float(start), 'end': float(min(start + 10, duration)),
+                       'text': " ".join(words)}
+            segments.append(segment)
+            if on_segment:
+                on_segment(segment)
+        return segments, duration
+    return transcriber
+
+
+# ============================================================================
+# SERVICES
+# ============================================================================
+
+def start_gateway(ollama_urls, port, work_dir, warmup=True):
+    """
+    Run the gateway under uvicorn, pointed at the mocks (from work_dir, so
+    its response cache file stays out of the repo)
+    Returns: (process, base URL) once /health answers OK (models warmed up)
+    """
+    env = dict(os.environ, OLLAMA_BACKENDS=",".join(ollama_urls),
+               WARMUP_MODELS="mistral" if warmup else "")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "ollama_api_updated:app",
+         "--app-dir", str(Path(__file__).resolve().parent),
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=work_dir, env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("gateway exited during start-up (is uvicorn installed?)")
+        try:
+            urllib.request.urlopen(f"{url}/health", timeout=1)
+            return process, url
+        except OSError:
+            # Not listening yet, or 503 while warming up
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("gateway was not healthy within 120s")
+
+
+# ============================================================================
+# MEASUREMENT
+# ============================================================================
+
+def percentile(values, pct):
+    """
+    Returns: nearest-rank percentile of values, or None if empty
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))]
+
+
+def peak_rss_mb():
+    """
+    Returns: peak resident memory of this process and its children (workers) in MB
+    """
+    if resource is None:
+        return None
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # ru_maxrss: bytes vs KB
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) / scale, 1)
+
+
+def scrape_prompt_eval(gateway_url):
+    """
+    Returns: {'generations', 'tokens', 'seconds'} totals for prompt evaluation
+    from the gateway's /metrics (zeros if unavailable)
+    """
+    totals = {'generations': 0, 'tokens': 0.0, 'seconds': 0.0}
+    try:
+        with urllib.request.urlopen(f"{gateway_url}/metrics", timeout=5) as response:
+            text = response.read().decode()
+    except OSError:
+        return totals
+    patterns = {
+        'generations': r'^ollama_tokens_count\{kind="prompt"\} (\S+)$',
+        'tokens': r'^ollama_tokens_sum\{kind="prompt"\} (\S+)$',
+        'seconds': r'^ollama_duration_seconds_sum\{phase="prompt_eval"\} (\S+)$',
+    }
+    for name, pattern in patterns.items():
+        match = re.search(pattern, text, re.MULTILINE)
+        if match:
+            totals[name] = float(match.group(1))
+    return totals
+
+
+def prompt_eval_summary(before, after):
+    generations = after['generations'] - before['generations']
+    if not generations:
+        return {'generations': 0, 'avg_tokens': None, 'avg_seconds': None}
+    return {
+        'generations': int(generations),
+        'avg_tokens': round((after['tokens'] - before['tokens']) / generations, 1),
+        'avg_seconds': round((after['seconds'] - before['seconds']) / generations, 4),
+    }
+
+
+def stage_summary(stage):
+    latencies = stage.latencies
+    return {
+        'processed': stage.processed,
+        'dropped': stage.dropped,
+        'busy_seconds': round(stage.busy_seconds, 3),
+        'p50': percentile(latencies, 50),
+        'p90': percentile(latencies, 90),
+        'p99': percentile(latencies, 99),
+        'max_queue': stage.max_depth,
+    }
+
+
+def run_benchmark(args, gateway_url, fixtures, work_dir):
+    """
+    Run the staged pipeline over the fixtures against the gateway
+    Returns: results dict
+    """
+    # Point the pipeline at the local gateway, away from real outputs and caches
+    catalyst.OLLAMA_ANALYZE_ENDPOINT = f"{gateway_url}/api/analyze"
+    catalyst.OLLAMA_BATCH_ENDPOINT = f"{gateway_url}/api/analyze/batch"
+    catalyst.OLLAMA_TEMPLATES_ENDPOINT = f"{gateway_url}/api/templates"
+    catalyst.PREFIX_TEMPLATE = not args.no_prefix_template
+    catalyst.USE_GATEWAY_CACHE = False
+    catalyst.STREAM_ANALYSIS = args.analysis == "stream"
+    catalyst.STRUCTURED_ANALYSIS = args.analysis == "structured"
+    catalyst.DEBUG_MODE = False
+    catalyst.PARTIAL_TRANSCRIPT_DIR = str(work_dir / "partial")
+    output_path = work_dir / "output"
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    pool = None
+    if args.skip_whisper:
+        transcriber = synthetic_transcriber(args.words_per_minute, args.seed)
+    elif args.workers > 1:
+        pool = catalyst.TranscriptionPool(args.workers, catalyst.default_cpu_threads(args.workers),
+                                          use_cache=False,
+                                          preload=catalyst.profile_models(args.profile))
+        pool.warm_up()
+
+        def transcriber(spark_file):
+            return pool.transcribe(spark_file, args.profile)
+    else:
+        models = catalyst.WhisperModels(catalyst.default_cpu_threads(1))
+        models.preload(catalyst.profile_models(args.profile))
+
+        def transcriber(spark_file, on_segment=None):
+            return catalyst.transcribe_spark_segments(spark_file, models, None,
+                                                      args.profile, on_segment)
+
+    analysis_before = dict(catalyst.analysis_stats)
+    prompt_eval_before = scrape_prompt_eval(gateway_url)
+    stages = []
+    started = time.perf_counter()
+    catalyst.run_clock.update(started=started, first_result=None)
+    try:
+        sparks = catalyst.run_staged_pipeline(
+            fixtures, transcriber, output_path,
+            transcribe_workers=max(1, args.workers),
+            analysis_batch_size=args.batch_size,
+            early_analysis=catalyst.EARLY_ANALYSIS and args.workers <= 1,
+            stages_out=stages,
+        )
+    finally:
+        if pool:
+            pool.shutdown()
+    wall = time.perf_counter() - started
+    prompt_eval = prompt_eval_summary(prompt_eval_before, scrape_prompt_eval(gateway_url))
+
+    analysis = {name: count - analysis_before.get(name, 0)
+                for name, count in catalyst.analysis_stats.items()}
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'config': {
+            'sparks': len(fixtures),
+            'spark_seconds': args.spark_seconds,
+            'workers': args.workers,
+            'batch_size': args.batch_size,
+            'profile': args.profile,
+            'analysis': args.analysis,
+            'prefix_template': not args.no_prefix_template,
+            'skip_whisper': args.skip_whisper,
+            'latency': args.latency,
+            'tokens_per_second': args.tokens_per_second,
+            'prompt_tokens_per_second': args.prompt_tokens_per_second,
+            'malformed_rate': args.malformed_rate,
+            'load_seconds': args.load_seconds,
+            'warmup': not args.no_warmup,
+            'backends': args.backends,
+        },
+        'completed': len(sparks),
+        'wall_seconds': round(wall, 3),
+        'first_result_seconds': round(catalyst.run_clock['first_result'], 3)
+        if catalyst.run_clock['first_result'] is not None else None,
+        'sparks_per_minute': round(len(sparks) / wall * 60, 3) if wall else 0.0,
+        'stages': {stage.name: stage_summary(stage) for stage in stages},
+        'analysis': analysis,
+        'prompt_eval': prompt_eval,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def print_results(results):
+    print()
+    print("=" * 70)
+    print("Benchmark results")
+    print("-" * 70)
+    print(f"{'stage':<12}{'done':>6}{'dropped':>9}{'p50 s':>9}{'p90 s':>9}{'p99 s':>9}{'max q':>7}")
+    for name, stage in results['stages'].items():
+        cells = [f"{stage[p]:>9.2f}" if stage[p] is not None else f"{'-':>9}"
+                 for p in ('p50', 'p90', 'p99')]
+        print(f"{name:<12}{stage['processed']:>6}{stage['dropped']:>9}{''.join(cells)}"
+              f"{stage['max_queue']:>7}")
+    print("-" * 70)
+    print(f"Throughput: {results['sparks_per_minute']:.2f} Sparks/min "
+          f"({results['completed']}/{results['config']['sparks']} in {results['wall_seconds']:.1f}s)")
+    if results['first_result_seconds'] is not None:
+        print(f"First result: {results['first_result_seconds']:.2f}s "
+              f"(gateway warm-up {'on' if results['config']['warmup'] else 'off'})")
+    analysis = results['analysis']
+    print(f"LLM requests: {analysis.get('requests', 0)}, "
+          f"full retries: {analysis.get('full_retries', 0)}, "
+          f"JSON failures: {analysis.get('json_failures', 0)}, "
+          f"field repairs: {analysis.get('field_repairs', 0)}")
+    prompt_eval = results['prompt_eval']
+    if prompt_eval['generations']:
+        print(f"Prompt eval per generation: {prompt_eval['avg_tokens']:.0f} tokens, "
+              f"{prompt_eval['avg_seconds'] * 1000:.0f} ms "
+              f"(instruction template {'on' if results['config']['prefix_template'] else 'off'})")
+    if results.get('backend_requests'):
+        print(f"Generations per backend: {results['backend_requests']}")
+    if results['peak_rss_mb'] is not None:
+        print(f"Peak RSS: {results['peak_rss_mb']:.0f} MB")
+
+
+def metric(results, name):
+    value = results
+    for part in name.split("."):
+        value = value.get(part, 0) if isinstance(value, dict) else None
+    return value
+
+
+def compare_results(results, previous_path):
+    """
+    Print how this run moved against a previous results file
+    """
+    previous = json.loads(Path(previous_path).read_text())
+    print()
+    print(f"Compared with {previous_path} ({previous.get('timestamp', '?')}):")
+    rows = [(name, higher, name) for name, higher in COMPARED_METRICS.items()]
+    rows += [(f"{name} p50", False, f"stages.{name}.p50") for name in results['stages']]
+    for label, higher_is_better, path in rows:
+        old, new = metric(previous, path), metric(results, path)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        better = change > 0 if higher_is_better else change < 0
+        # Ignore noise: under 5% or under 10 ms either way
+        flag = "" if abs(change) < 0.05 or abs(new - old) < 0.01 else \
+            ("  ✓" if better else "  ⚠ regression")
+        print(f"  {label:<24}{old:>10.2f} → {new:<10.2f}{change:>+8.1%}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Catalyst pipeline against a mock Ollama")
+    parser.add_argument("--sparks", type=int, default=6, help="Synthetic Sparks to generate")
+    parser.add_argument("--spark-seconds", type=float, default=90.0, help="Length of each Spark")
+    parser.add_argument("--fixtures", default=os.path.join(tempfile.gettempdir(), "catalyst-fixtures"),
+                        help="Where fixtures are generated (reused across runs)")
+    parser.add_argument("--skip-whisper", action="store_true",
+                        help="Use synthetic transcripts instead of running Whisper")
+    parser.add_argument("--words-per-minute", type=int, default=150,
+                        help="Speaking rate for --skip-whisper transcripts")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--profile", choices=sorted(catalyst.TRANSCRIBE_PROFILES) + ["auto"],
+                        default=catalyst.TRANSCRIBE_PROFILE)
+    parser.add_argument("--analysis", choices=["stream", "structured"], default="stream",
+                        help="How single-shot analysis reaches /api/analyze")
+    parser.add_argument("--latency", type=float, default=0.5,
+                        help="Mock Ollama seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=40.0,
+                        help="Mock Ollama generation speed")
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=400.0,
+                        help="Mock Ollama prompt evaluation speed (uncached tokens)")
+    parser.add_argument("--load-seconds", type=float, default=0.0,
+                        help="Mock Ollama cold model load time")
+    parser.add_argument("--no-warmup", action="store_true",
+                        help="Start the gateway without preloading Mistral")
+    parser.add_argument("--no-prefix-template", action="store_true",
+                        help="Send whole prompts instead of registering the analysis "
+                             "instructions as a gateway template")
+    parser.add_argument("--backends", type=int, default=1,
+                        help="Mock Ollama hosts behind the gateway's backend pool")
+    parser.add_argument("--malformed-rate", type=float, default=0.0,
+                        help="Fraction of mock responses that are not valid JSON")
+    parser.add_argument("--gateway", help="Use this running gateway instead of starting one "
+                                          "(mock options then do not apply)")
+    parser.add_argument("--gateway-port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="Results file (default: benchmark-results/pipeline-<time>.json)")
+    parser.add_argument("--compare", help="Previous results file to compare against")
+    args = parser.parse_args()
+
+    fixtures = make_fixtures(Path(args.fixtures), args.sparks, args.spark_seconds, args.seed)
+    print(f"🧪 {len(fixtures)} fixtures of {args.spark_seconds:.0f}s in {fixtures[0].parent}")
+
+    mocks = []
+    gateway = None
+    with tempfile.TemporaryDirectory(prefix="catalyst-bench-") as work_dir:
+        try:
+            if args.gateway:
+                gateway_url = args.gateway.rstrip("/")
+            else:
+                ollama_urls = []
+                for _ in range(args.backends):
+                    mock, ollama_url = start_mock_ollama(0, args.latency, args.tokens_per_second,
+                                                         args.malformed_rate, args.seed,
+                                                         args.prompt_tokens_per_second,
+                                                         args.load_seconds)
+                    mocks.append(mock)
+                    ollama_urls.append(ollama_url)
+                gateway_started = time.perf_counter()
+                gateway, gateway_url = start_gateway(ollama_urls, args.gateway_port, work_dir,
+                                                     warmup=not args.no_warmup)
+                print(f"🧪 Gateway healthy after {time.perf_counter() - gateway_started:.1f}s")
+                print(f"🧪 Mock Ollama {', '.join(ollama_urls)} behind gateway {gateway_url}")
+            print()
+
+            results = run_benchmark(args, gateway_url, fixtures, Path(work_dir))
+            # Generations each mock served (warm-up loads aren't counted)
+            results['backend_requests'] = [mock.RequestHandlerClass.settings.requests
+                                           for mock in mocks]
+        finally:
+            if gateway:
+                gateway.terminate()
+                gateway.wait()
+            for mock in mocks:
+                mock.shutdown()
+
+    print_results(results)
+
+    json_path = Path(args.json) if args.json else \
+        RESULTS_DIR / f"pipeline-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    json_path.parent.mkdir(parents=True, exist_ok=True)
+    json_path.write_text(json.dumps(results, indent=2))
+    print(f"\n📊 Results written: {json_path}")
+
+    if args.compare:
+        compare_results(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
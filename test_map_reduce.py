@@ -0,0 +1,57 @@
+"""
+Map-reduce analysis must survive chunk analyses that don't match
+ANALYSIS_SCHEMA: Mistral (without structured output) sometimes answers a
+list field with a string, or a single-valued field with a list or object.
+
+Run with: python -m pytest test_map_reduce.py
+"""
+
+import catalyst_demo_v2 as catalyst
+
+
+def chunks(count):
+    return [[{'start': i * 10.0, 'end': i * 10.0 + 10, 'text': f"part {i}"}]
+            for i in range(count)]
+
+
+def run_map_reduce(monkeypatch, partials):
+    monkeypatch.setattr(catalyst, "analyze_batch_with_mistral",
+                        lambda transcripts, debug=False: dict(zip(transcripts, partials)))
+    monkeypatch.setattr(catalyst, "request_json_completion", lambda prompt, debug=False: None)
+    return catalyst.analyze_map_reduce(chunks(len(partials)))
+
+
+def test_malformed_chunk_outputs_are_normalized(monkeypatch):
+    analysis = run_map_reduce(monkeypatch, [
+        {'category': "technical", 'evolution_phase': ["awareness", "exploration"],
+         'insight_type': {"type": "decision"}, 'energy': "high",
+         'key_concepts': "focus", 'summary': "First part"},
+        {'category': ["technical", {"name": "business"}], 'evolution_phase': "awareness",
+         'insight_type': ["decision"], 'energy': ["high"],
+         'key_concepts': ["focus", ["nested"], 7], 'summary': ["Second part"]},
+        {'category': None, 'evolution_phase': {}, 'key_concepts': {"a": 1}, 'summary': 3},
+    ])
+
+    assert analysis['category'] == ["technical"]
+    assert analysis['evolution_phase'] == "awareness"
+    assert analysis['insight_type'] == "decision"
+    assert analysis['energy'] == "high"
+    assert analysis['key_concepts'] == ["focus", "7"]
+    assert analysis['summary'] == "First part Second part 3"
+    assert analysis['methodology_alignment'] == "Not analyzed"
+
+
+def test_non_dict_chunk_outputs_are_skipped(monkeypatch):
+    analysis = run_map_reduce(monkeypatch, [
+        ["not", "an", "object"],
+        None,
+        {'category': ["fitness"], 'evolution_phase': "integration", 'summary': "Only part"},
+    ])
+
+    assert analysis['category'] == ["fitness"]
+    assert analysis['evolution_phase'] == "integration"
+    assert analysis['summary'] == "Only part"
+
+
+def test_every_chunk_failing_returns_none(monkeypatch):
+    assert run_map_reduce(monkeypatch, [None, "garbage"]) is None
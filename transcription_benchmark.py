@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Transcription Benchmark - files/minute at different worker counts, or
+speed vs. quality of each transcription profile
+
+Workers: runs the same sample of Sparks through catalyst_demo_v2's
+TranscriptionPool at 1, 2, 4 and 8 workers (threads per worker = cores /
+workers) and prints throughput for each.
+
+Profiles: transcribes the sample once per profile in TRANSCRIBE_PROFILES and
+reports real-time factor (processing seconds / audio seconds) and, where a
+reference transcript <stem>.txt exists in --references, word error rate.
+
+The transcript cache is bypassed so every run does real work.
+
+Usage: python transcription_benchmark.py --input /mnt/z/Sparks --files 16
+       python transcription_benchmark.py --profiles fast,balanced,accurate --references refs/
+"""
+
+import os
+import re
+import json
+import time
+import argparse
+from pathlib import Path
+
+import catalyst_demo_v2 as catalyst
+
+
+def benchmark_workers(files, workers, cpu_threads):
+    """
+    Transcribe every file with a fresh pool of `workers` processes
+    Returns: dict of timings (model load excluded)
+    """
+    # Models load lazily, so name the ones TRANSCRIBE_PROFILE uses for the
+    # workers to load at start-up, before the timing starts
+    pool = catalyst.TranscriptionPool(
+        workers, cpu_threads, use_cache=False,
+        preload=catalyst.profile_models(catalyst.TRANSCRIBE_PROFILE),
+    )
+    try:
+        # Model load is a one-off cost per run; keep it out of the timing
+        pool.warm_up()
+
+        started = time.perf_counter()
+        futures = [pool.submit(f) for f in files]
+        chars = sum(len(catalyst.join_segments(future.result()[0])) for future in futures)
+        elapsed = time.perf_counter() - started
+    finally:
+        pool.shutdown()
+
+    return {
+        'workers': workers,
+        'cpu_threads': cpu_threads,
+        'files': len(files),
+        'seconds': elapsed,
+        'files_per_minute': len(files) / elapsed * 60,
+        'transcript_chars': chars,
+    }
+
+
+def normalize_words(text):
+    """
+    Returns: lowercase words with punctuation stripped, for WER scoring
+    """
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+def word_error_rate(reference, hypothesis):
+    """
+    Word-level Levenshtein distance divided by the reference length
+    Returns: float (0.0 is a perfect match), or None for an empty reference
+    """
+    ref, hyp = normalize_words(reference), normalize_words(hypothesis)
+    if not ref:
+        return None
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1,            # deletion
+                               current[j - 1] + 1,         # insertion
+                               previous[j - 1] + (ref_word != hyp_word)))  # substitution
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def benchmark_profile(files, profile, models, references):
+    """
+    Transcribe every file in-process with one profile
+    Returns: dict with real-time factor and mean WER (model load excluded)
+    """
+    settings = catalyst.transcription_settings(profile)
+    models.get(settings['model'])
+
+    processing = audio = 0.0
+    error_rates = []
+    for f in files:
+        started = time.perf_counter()
+        segments, duration = catalyst.transcribe_spark_segments(f, models, profile=profile)
+        processing += time.perf_counter() - started
+        audio += duration or 0.0
+        if f.stem in references:
+            wer = word_error_rate(references[f.stem], catalyst.join_segments(segments))
+            if wer is not None:
+                error_rates.append(wer)
+
+    return {
+        'profile': profile,
+        'model': settings['model'],
+        'beam_size': settings['beam_size'],
+        'files': len(files),
+        'processing_seconds': processing,
+        'audio_seconds': audio,
+        'rtf': processing / audio if audio else None,
+        'wer': sum(error_rates) / len(error_rates) if error_rates else None,
+        'scored_files': len(error_rates),
+    }
+
+
+def run_profiles(files, profiles, references_dir, cpu_threads):
+    references = {}
+    if references_dir:
+        references = {ref.stem: ref.read_text(encoding='utf-8')
+                      for ref in Path(references_dir).glob("*.txt")}
+    scored = sum(1 for f in files if f.stem in references)
+    print(f"Benchmarking profiles on {len(files)} Sparks ({scored} with reference transcripts)")
+    print()
+    print(f"{'profile':>10}{'model':>8}{'beam':>6}{'audio s':>10}{'RTF':>8}{'WER':>8}")
+
+    models = catalyst.WhisperModels(cpu_threads)
+    results = []
+    for profile in profiles:
+        result = benchmark_profile(files, profile, models, references)
+        results.append(result)
+        rtf = f"{result['rtf']:.3f}" if result['rtf'] is not None else "n/a"
+        wer = f"{result['wer']:.1%}" if result['wer'] is not None else "n/a"
+        print(f"{profile:>10}{result['model']:>8}{result['beam_size']:>6}"
+              f"{result['audio_seconds']:>10.0f}{rtf:>8}{wer:>8}")
+    return results
+
+
+def write_results(results, path):
+    if path:
+        Path(path).write_text(json.dumps(results, indent=2))
+        print(f"\n📊 Results written: {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parallel transcription")
+    parser.add_argument("--input", default=catalyst.INPUT_DIR, help="Directory of Sparks")
+    parser.add_argument("--files", type=int, default=16, help="How many Sparks to sample")
+    parser.add_argument("--workers", default="1,2,4,8",
+                        help="Comma-separated worker counts to try")
+    parser.add_argument("--profiles",
+                        help="Comma-separated transcription profiles to compare "
+                             "(instead of the worker sweep)")
+    parser.add_argument("--references",
+                        help="Directory of reference transcripts named <spark stem>.txt")
+    parser.add_argument("--json", help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    extensions = {'.mp4', '.mov', '.avi', '.mkv', '.webm', '.m4a', '.mp3', '.wav'}
+    files = sorted(f for f in Path(args.input).iterdir()
+                   if f.suffix.lower() in extensions)[:args.files]
+    if not files:
+        print(f"❌ No Sparks found in {args.input}")
+        return
+
+    cores = os.cpu_count() or 1
+    if args.profiles:
+        profiles = args.profiles.split(",")
+        unknown = [p for p in profiles if p not in catalyst.TRANSCRIBE_PROFILES]
+        if unknown:
+            print(f"❌ Unknown profiles: {', '.join(unknown)}")
+            return
+        results = run_profiles(files, profiles, args.references, cores)
+        write_results(results, args.json)
+        return
+
+    models = ", ".join(catalyst.profile_models(catalyst.TRANSCRIBE_PROFILE))
+    print(f"Benchmarking {len(files)} Sparks on {cores} cores, "
+          f"profile '{catalyst.TRANSCRIBE_PROFILE}' (model {models})")
+    print()
+    print(f"{'workers':>8}{'threads':>9}{'seconds':>10}{'files/min':>11}{'speedup':>9}")
+
+    results = []
+    for workers in [int(w) for w in args.workers.split(",")]:
+        result = benchmark_workers(files, workers, max(1, cores // workers))
+        results.append(result)
+        speedup = result['files_per_minute'] / results[0]['files_per_minute']
+        print(f"{result['workers']:>8}{result['cpu_threads']:>9}{result['seconds']:>10.1f}"
+              f"{result['files_per_minute']:>11.2f}{speedup:>8.2f}x")
+
+    write_results(results, args.json)
+
+
+if __name__ == "__main__":
+    main()